@@ -6,24 +6,31 @@ in a text file or a list of strings.
 """
 
 from map_reduce.client.server_interface import ServerInterface
-from typing import List, Tuple
+from map_reduce.client.shards import read_shards, shard_paths
+from map_reduce.server.jit_reducers import jit_friendly
+from map_reduce.server.utils import line_offsets
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
 import argparse
 import os
 
+import numpy as np
+
 def map_function(line_num: int, line: str) -> List[Tuple[str, int]]:
     """
-    Map function that splits each line into words and emits (word, 1) pairs.
+    Map function that splits each line into words and emits (word, count) pairs.
     
     Args:
         line_num: Line number in the input text
         line: The text line to process
     
     Returns:
-        List of tuples containing (word, 1) pairs
+        List of tuples containing (word, count) pairs, one per distinct word
     """
-    # Split line into words and emit (word, 1) for each word
-    return [(word.lower(), 1) for word in line.split()]
+    # Count words within the line so each word is emitted only once
+    return list(Counter(word.lower() for word in line.split()).items())
 
+@jit_friendly
 def reduce_function(word: str, counts: List[int]) -> int:
     """
     Reduce function that sums up all counts for each word.
@@ -37,17 +44,32 @@ def reduce_function(word: str, counts: List[int]) -> int:
     """
     return sum(counts)
 
+def sort_by_count(results: Dict[str, int]) -> Iterable[Tuple[str, int]]:
+    """
+    Sort word counts in descending order of count, ties keep their original order.
+    
+    Args:
+        results: Mapping of words to their total count
+    
+    Returns:
+        Iterable of (word, count) pairs sorted by count
+    """
+    words = np.fromiter(results.keys(), dtype=object, count=len(results))
+    counts = np.fromiter(results.values(), dtype=np.int64, count=len(results))
+    order = np.argsort(-counts, kind='stable')
+    return zip(words[order].tolist(), counts[order].tolist())
+
 def process_file(filepath: str) -> None:
     """
     Process a text file using MapReduce to count word occurrences.
     
     Args:
-        filepath: Path to the text file to process
+        filepath: Path or glob pattern of the text file(s) to process
     """
-    # Read input data
+    # Read all shards in parallel into one raw buffer, lines are located by their offsets
     try:
-        with open(filepath, 'r') as f:
-            data = [line.strip() for line in f if line.strip()]
+        raw = b'\n'.join(read_shards(shard_paths(filepath)))
+        offsets = line_offsets(raw)
     except FileNotFoundError:
         print(f"Error: File '{filepath}' not found")
         return
@@ -60,9 +82,9 @@ def process_file(filepath: str) -> None:
     
     # Start MapReduce processing
     print(f"Processing file: {filepath}")
-    print(f"Total lines to process: {len(data)}")
+    print(f"Total lines to process: {len(offsets) - 1}")
     
-    if daemon := server.startup(data, map_function, reduce_function):
+    if daemon := server.startup((raw, offsets), map_function, reduce_function):
         print("MapReduce tasks started, processing...")
         results = server.await_results()
         
@@ -70,7 +92,7 @@ def process_file(filepath: str) -> None:
         print("\nWord Count Results:")
         print("-" * 40)
         # Sort by count in descending order
-        sorted_results = sorted(results.items(), key=lambda x: x[1], reverse=True)
+        sorted_results = sort_by_count(results)
         for word, count in sorted_results:
             print(f"{word}: {count}")
         print("-" * 40)
@@ -88,7 +110,7 @@ def main():
     ]
     
     parser = argparse.ArgumentParser(description='Word Count using MapReduce')
-    parser.add_argument('--file', '-f', help='Input text file to process')
+    parser.add_argument('--file', '-f', help='Input text file (or glob of shards) to process')
     args = parser.parse_args()
     
     if args.file:
@@ -102,7 +124,7 @@ def main():
             
             print("\nWord Count Results:")
             print("-" * 40)
-            sorted_results = sorted(results.items(), key=lambda x: x[1], reverse=True)
+            sorted_results = sort_by_count(results)
             for word, count in sorted_results:
                 print(f"{word}: {count}")
             print("-" * 40)
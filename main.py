@@ -21,8 +21,9 @@ from Pyro4 import Daemon, URI
 
 from map_reduce.client.client import run_client
 from map_reduce.server.configs import (BROADCAST_PORT, DAEMON_PORT, DHT_NAME,
-                                     FOLLOWER_NAME, IP, MASTER_NAME,
-                                     RQ_HANDLER_NAME)
+                                     FOLLOWER_NAME, MASTER_NAME,
+                                     RQ_HANDLER_NAME, THREADPOOL_SIZE_MIN,
+                                     get_ip)
 from map_reduce.server.dht import ChordNode, ChordService, service_address
 from map_reduce.server.logger import get_logger
 from map_reduce.server.nameserver import NameServer
@@ -30,11 +31,13 @@ from map_reduce.server.nodes import Follower, Master, RequestHandler
 
 # Configure Pyro4
 Pyro4.config.SERVERTYPE = 'thread'
-Pyro4.config.SERIALIZER = 'dill'
-Pyro4.config.SERIALIZERS_ACCEPTED.add('dill')
+Pyro4.config.THREADPOOL_SIZE_MIN = THREADPOOL_SIZE_MIN
+Pyro4.config.SOCK_NODELAY = True
+Pyro4.config.SERIALIZER = 'pickle'
+Pyro4.config.SERIALIZERS_ACCEPTED.add('pickle')
 
 logger = get_logger('main')
-logger = logging.LoggerAdapter(logger, {'IP': IP})
+logger = logging.LoggerAdapter(logger, {'IP': get_ip()})
 
 class MapReduceServer:
     """Main server class that manages all components of the MapReduce system."""
@@ -45,23 +48,24 @@ class MapReduceServer:
         self.dht: Optional[ChordNode] = None
         self.dht_service: Optional[ChordService] = None
         self.running: bool = False
+        self.ip: str = get_ip()
         
         # Setup addresses
-        self.dht_address = URI(f'PYRO:{DHT_NAME}@{IP}:{DAEMON_PORT}')
+        self.dht_address = URI(f'PYRO:{DHT_NAME}@{self.ip}:{DAEMON_PORT}')
         self.dht_service_address = service_address(self.dht_address)
-        self.master_address = URI(f'PYRO:{MASTER_NAME}@{IP}:{DAEMON_PORT}')
-        self.follower_address = URI(f'PYRO:{FOLLOWER_NAME}@{IP}:{DAEMON_PORT}')
-        self.rqh_address = URI(f'PYRO:{RQ_HANDLER_NAME}@{IP}:{DAEMON_PORT}')
+        self.master_address = URI(f'PYRO:{MASTER_NAME}@{self.ip}:{DAEMON_PORT}')
+        self.follower_address = URI(f'PYRO:{FOLLOWER_NAME}@{self.ip}:{DAEMON_PORT}')
+        self.rqh_address = URI(f'PYRO:{RQ_HANDLER_NAME}@{self.ip}:{DAEMON_PORT}')
 
     def setup_daemon(self, objects: Dict) -> None:
         """Setup main daemon with the provided objects."""
-        self.daemon = Pyro4.Daemon(host=IP, port=DAEMON_PORT)
+        self.daemon = Pyro4.Daemon(host=self.ip, port=DAEMON_PORT)
         for name, obj in objects.items():
             self.daemon.register(obj, name)
 
     def setup_nameserver(self) -> None:
         """Setup and configure the nameserver."""
-        self.nameserver = NameServer(IP, BROADCAST_PORT)
+        self.nameserver = NameServer(self.ip, BROADCAST_PORT)
         self.nameserver.delegate(
             self.rqh_address, 
             self.request_handler.start, 
@@ -130,8 +134,8 @@ class MapReduceServer:
         self.running = True
         logger.info('Server started successfully')
         try:
-            while self.running and self.daemon:
-                self.daemon.requestLoop(timeout=1.0)
+            # Blocks until shutdown; daemon.shutdown() wakes the loop up by itself.
+            self.daemon.requestLoop(loopCondition=lambda: self.running)
         except Exception as e:
             logger.error(f'Error in main loop: {e}')
             self.shutdown()
@@ -1,20 +1,80 @@
 from pprint import pp
 from map_reduce.client.server_interface import ServerInterface as server
 
+import collections.abc
+import inspect
 import os
-from typing import Any, Callable, List, Tuple, TypeVar
+import weakref
+from collections import Counter
+from typing import (Any, Callable, List, Optional, Tuple, TypeVar, get_origin,
+                    get_type_hints)
 
 K = TypeVar('K')
 V = TypeVar('V')
 
+POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+SEQUENCE_TYPES = (list, collections.abc.Sequence, collections.abc.Iterable)
+
+# Functions whose validation had to call them. Keyed on the function itself, since
+# qualified names are shared by lambdas and redefined functions.
+_probed_functions: 'weakref.WeakSet[Callable]' = weakref.WeakSet()
+
+def _hint_matches(hint: Any, types: tuple) -> bool:
+    """Check whether a type hint (or its generic origin) is one of the given types"""
+    return hint is Any or (get_origin(hint) or hint) in types
+
+def inspect_function(func: Callable, value_types: tuple, return_types: tuple) -> Optional[bool]:
+    """
+    Check a function's signature against a (key, value) -> result schema without
+    calling it. Returns None when the signature and type hints are inconclusive.
+    """
+    try:
+        params = list(inspect.signature(func).parameters.values())
+        hints = get_type_hints(func)
+    except (TypeError, ValueError, NameError):
+        return None
+    positional = [p for p in params if p.kind in POSITIONAL]
+    required = [p for p in positional if p.default is p.empty]
+    variadic = any(p.kind == inspect.Parameter.VAR_POSITIONAL for p in params)
+    if len(required) > 2 or (len(positional) < 2 and not variadic):
+        raise ValueError("Function must take exactly two positional arguments")
+    if len(positional) < 2 or positional[1].name not in hints or 'return' not in hints:
+        return None
+    if not _hint_matches(hints[positional[1].name], value_types):
+        raise ValueError(f"Second argument must be annotated as one of {value_types}")
+    if return_types and not _hint_matches(hints['return'], return_types):
+        raise ValueError(f"Return value must be annotated as one of {return_types}")
+    return True
+
+def _probe_function(func: Callable, probe: Callable) -> bool:
+    """Validate a function by calling it, only once per function"""
+    try:
+        if func in _probed_functions:
+            return True
+    except TypeError:
+        # Not weakly referenceable, such as builtins, probe it every time.
+        probe(func)
+        return True
+    probe(func)
+    _probed_functions.add(func)
+    return True
+
+def _probe_map_function(func: Callable):
+    result = func(0, "test string")
+    if not isinstance(result, list):
+        raise ValueError("Map function must return a list")
+    if result and not isinstance(result[0], tuple):
+        raise ValueError("Map function must return list of tuples")
+
+def _probe_reduce_function(func: Callable):
+    func("test", [1, 2, 3])
+
 def validate_map_function(func: Callable) -> bool:
     """Validate that map function follows required schema"""
     try:
-        result = func(0, "test string")
-        if not isinstance(result, list):
-            raise ValueError("Map function must return a list")
-        if result and not isinstance(result[0], tuple):
-            raise ValueError("Map function must return list of tuples")
+        value_types = SEQUENCE_TYPES if getattr(func, '__vectorizable__', False) else (str,)
+        if inspect_function(func, value_types, SEQUENCE_TYPES) is None:
+            return _probe_function(func, _probe_map_function)
         return True
     except Exception as e:
         print(f"Invalid map function: {str(e)}")
@@ -23,7 +83,8 @@ def validate_map_function(func: Callable) -> bool:
 def validate_reduce_function(func: Callable) -> bool:
     """Validate that reduce function follows required schema"""
     try:
-        result = func("test", [1, 2, 3])
+        if inspect_function(func, SEQUENCE_TYPES, ()) is None:
+            return _probe_function(func, _probe_reduce_function)
         return True
     except Exception as e:
         print(f"Invalid reduce function: {str(e)}")
@@ -31,10 +92,7 @@ def validate_reduce_function(func: Callable) -> bool:
 
 def map(doc_line: int, doc_line_text: str) -> List[Tuple[str, int]]:
     """Map function that splits text into words and counts them"""
-    res = []
-    for word in doc_line_text.split():
-        res.append((word, 1))
-    return res
+    return list(Counter(doc_line_text.split()).items())
 
 def reduce(word: str, vals: List[int]) -> int:
     """Reduce function that sums up word counts"""
@@ -47,16 +105,17 @@ def run_client(data_file: str = 'map_reduce/client/data.txt'):
         if not os.path.exists(data_file):
             raise FileNotFoundError(f"Data file not found: {data_file}")
             
-        # Read data
-        with open(data_file) as file:
-            data = [line.strip() for line in file.readlines()]
-            
         # Validate functions
         if not validate_map_function(map) or not validate_reduce_function(reduce):
             raise ValueError("Invalid map/reduce functions")
             
+        # Stream data, lines are packed in chunks as they are read
+        with open(data_file) as file:
+            data = (line.strip() for line in file if line.strip())
+            daemon = server.startup(data, map, reduce)
+
         # Start processing
-        if daemon := server.startup(data, map, reduce):
+        if daemon:
             print('MapReduce tasks started, awaiting results...')
             server.await_results()
             pp(server.results, indent=4, sort_dicts=True)
@@ -1,52 +1,133 @@
 import Pyro4
-Pyro4.config.SERIALIZER = 'dill'
-Pyro4.config.SERIALIZERS_ACCEPTED.add('dill')
+Pyro4.config.SERIALIZER = 'pickle'
+Pyro4.config.SERIALIZERS_ACCEPTED.add('pickle')
+Pyro4.config.SOCK_NODELAY = True
 import Pyro4.errors
-import Pyro4.socketutil
 
 import threading
 from time import sleep
-from typing import Any
+from typing import Any, Callable
 
-from map_reduce.server.utils import spawn_thread
+from map_reduce.server.configs import get_ip
+from map_reduce.server.utils import locate_ns, pack_lines, serialize_function, spawn_thread
 
 AWAIT_INTERVAL = 1
-IP = Pyro4.socketutil.getIpAddress(None, workaround127=None)
+BALANCE_STRATEGIES = (None, 'sample')
 
 class ServerInterface:
     results = None
-    results_lock = threading.Lock()
+    results_ready = threading.Event()
+    serialized_functions: dict[int, tuple[Callable, bytes]] = {}
+    _ns_uri: Pyro4.URI = None
+    _rq_proxy: Pyro4.Proxy = None
 
     @classmethod
     @Pyro4.expose
     def notify_results(cls, results: Any):
         cls.results = results
-        cls.results_lock.release()
+        cls.results_ready.set()
+
+    @classmethod
+    def serialize(cls, func: Callable) -> bytes:
+        '''
+        Serializes a function once, subsequent calls reuse the cached payload.
+        '''
+        if func is None:
+            return None
+        cached = cls.serialized_functions.get(id(func))
+        if cached is None or cached[0] is not func:
+            cached = cls.serialized_functions[id(func)] = (func, serialize_function(func))
+        return cached[1]
+
+    @classmethod
+    def _nameserver(cls) -> Pyro4.Proxy:
+        '''
+        Returns a proxy to the nameserver. Its location is only broadcast for once,
+        later calls reuse the resolved URI.
+        '''
+        if cls._ns_uri is None:
+            with locate_ns() as ns:
+                cls._ns_uri = ns._pyroUri
+        return Pyro4.Proxy(cls._ns_uri)
+
+    @classmethod
+    def _request_handler(cls) -> Pyro4.Proxy:
+        '''
+        Returns a long-lived proxy to the request handler, its connection is kept
+        open across jobs. The registered handler is looked up on every call, since
+        it moves along with the nameserver leader, and the proxy is rebound if so.
+        '''
+        with cls._nameserver() as ns:
+            uri = ns.lookup('rq.handler')
+        if cls._rq_proxy is not None and cls._rq_proxy._pyroUri != uri:
+            cls._rq_proxy._pyroRelease()
+            cls._rq_proxy = None
+        if cls._rq_proxy is None:
+            proxy = Pyro4.Proxy(uri)
+            proxy._pyroBind()
+            cls._rq_proxy = proxy
+        return cls._rq_proxy
+
+    @classmethod
+    def _reset_proxies(cls):
+        ''' Drops the cached nameserver and request handler references. '''
+        if cls._rq_proxy is not None:
+            cls._rq_proxy._pyroRelease()
+        cls._rq_proxy = None
+        cls._ns_uri = None
     
     @classmethod
-    def startup(cls, data, map_f, reduce_f) -> Pyro4.Daemon:
-        # Acquire lock for await function.
-        cls.results_lock.acquire()
+    def startup(cls, data, map_f, reduce_f, combiner_f=None, balance=None) -> Pyro4.Daemon:
+        '''
+        Requests a map-reduce job over `data`. Map outputs are folded per chunk with
+        `combiner_f` before being shipped to the master, which defaults to `reduce_f`
+        and thus assumes the reduce function is associative and commutative. Pass
+        `combiner_f=False` for reduce functions which are not, such as counting or
+        averaging the values, to ship map outputs as they are.
+
+        `data` may be a list of lines, a `(raw, offsets)` buffer pair or any other
+        iterable of lines, which is consumed lazily and packed into a buffer pair.
+
+        With `balance='sample'` the reduce keys are grouped into one partition per
+        follower, with boundaries sampled from the mapped key distribution.
+        '''
+        if balance not in BALANCE_STRATEGIES:
+            raise ValueError(f'Unknown balance strategy {balance!r}.')
+
+        if not isinstance(data, (list, tuple)):
+            data = pack_lines(data)
+
+        # An empty combine code stages no combiner at all.
+        combiner = b'' if combiner_f is False else cls.serialize(combiner_f or reduce_f)
+
+        # Reset the event for the await function.
+        cls.results_ready.clear()
 
         # Instance a daemon to expose class.
-        daemon = Pyro4.Daemon(host=IP, port=8008)
+        daemon = Pyro4.Daemon(host=get_ip(), port=8008)
         addr = daemon.register(cls, 'client')
 
         # Start the request for map-reduce server.
-        with Pyro4.locateNS() as ns:
-            while True:
-                try:
-                    with Pyro4.Proxy(ns.lookup('rq.handler')) as server:
-                        if server.startup(addr, data, map_f, reduce_f):
-                            spawn_thread(target=daemon.requestLoop)
-                            return daemon
-                        else:
-                            print("Server couldn't start up due to a communication error.")
-                            return None
-                except Pyro4.errors.NamingError:
-                    sleep(1)
+        while True:
+            try:
+                server = cls._request_handler()
+                if server.startup(addr, data, cls.serialize(map_f),
+                                  cls.serialize(reduce_f),
+                                  combiner,
+                                  balance):
+                    spawn_thread(target=daemon.requestLoop)
+                    return daemon
+                else:
+                    print("Server couldn't start up due to a communication error.")
+                    return None
+            except Pyro4.errors.NamingError:
+                sleep(1)
+            except Pyro4.errors.CommunicationError:
+                # The nameserver or handler may have been replaced, locate them again.
+                cls._reset_proxies()
+                sleep(1)
     
     @classmethod
     def await_results(cls):
-        cls.results_lock.acquire()
-        cls.results_lock.release()
\ No newline at end of file
+        cls.results_ready.wait()
+        return cls.results
\ No newline at end of file
@@ -0,0 +1,35 @@
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_PARALLEL_READS = 64
+
+
+def shard_paths(pattern: str) -> list[str]:
+    ''' Returns the sorted paths of the input shards matching a glob pattern. '''
+    paths = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+    if not paths:
+        raise FileNotFoundError(f"No input shards match '{pattern}'")
+    return paths
+
+def read_shard(path: str) -> bytearray:
+    ''' Reads a whole shard into a buffer preallocated from its size on disk. '''
+    with open(path, 'rb', buffering=0) as file:
+        buffer = bytearray(os.fstat(file.fileno()).st_size)
+        read = 0
+        with memoryview(buffer) as view:
+            while read < len(buffer) and (n := file.readinto(view[read:])):
+                read += n
+    if read < len(buffer):
+        del buffer[read:]
+    return buffer
+
+def read_shards(paths: list[str], max_workers: int = MAX_PARALLEL_READS) -> list[bytearray]:
+    '''
+    Reads every shard in parallel. File reads release the GIL, so all shards are
+    in flight at once instead of being read one blocking call after another.
+    '''
+    if len(paths) == 1:
+        return [read_shard(paths[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(read_shard, paths))
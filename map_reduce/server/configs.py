@@ -4,8 +4,10 @@ Handles all system-wide settings and provides validation.
 """
 from __future__ import annotations
 
+import functools
 import os
 from dataclasses import dataclass
+from types import MappingProxyType
 from typing import Dict, Optional
 
 import Pyro4.socketutil
@@ -21,14 +23,25 @@ class LogConfig(TypedDict):
     json_format: bool
     log_file: Optional[str]
 
-@dataclass
+@functools.lru_cache(maxsize=None)
+def get_ip() -> str:
+    """Returns the IP address of this machine, resolved once on first use."""
+    return Pyro4.socketutil.getIpAddress(None, workaround127=None)
+
+@dataclass(frozen=True)
 class NetworkConfig:
     """Network-related configuration."""
-    ip: str = Pyro4.socketutil.getIpAddress(None, workaround127=None)
     daemon_port: int = int(os.getenv('MR_DAEMON_PORT', '8008'))
     broadcast_port: int = int(os.getenv('MR_BROADCAST_PORT', '8009'))
     request_timeout: float = float(os.getenv('MR_REQUEST_TIMEOUT', '0.5'))
     request_retries: int = int(os.getenv('MR_REQUEST_RETRIES', '5'))
+    threadpool_size_min: int = int(os.getenv('MR_THREADPOOL_SIZE_MIN', '16'))
+    proxy_pool_size: int = int(os.getenv('MR_PROXY_POOL_SIZE', '64'))
+
+    @property
+    def ip(self) -> str:
+        """IP address of this machine, see `get_ip`."""
+        return get_ip()
 
     def validate(self) -> None:
         """Validate network configuration."""
@@ -40,8 +53,12 @@ class NetworkConfig:
             raise ConfigError(f"Invalid request timeout: {self.request_timeout}")
         if self.request_retries < 1:
             raise ConfigError(f"Invalid request retries: {self.request_retries}")
+        if self.threadpool_size_min < 1:
+            raise ConfigError(f"Invalid threadpool minimum size: {self.threadpool_size_min}")
+        if self.proxy_pool_size < 1:
+            raise ConfigError(f"Invalid proxy pool size: {self.proxy_pool_size}")
 
-@dataclass
+@dataclass(frozen=True)
 class DHTConfig:
     """DHT (Distributed Hash Table) configuration."""
     name: str = 'chord.dht'
@@ -60,12 +77,13 @@ class DHTConfig:
         if self.replication_size < 1:
             raise ConfigError(f"Invalid replication size: {self.replication_size}")
 
-@dataclass
+@dataclass(frozen=True)
 class TaskConfig:
     """Task execution configuration."""
     max_timeout: int = int(os.getenv('MR_MAX_TASK_TIMEOUT', '300'))  # 5 minutes
     items_per_chunk: int = int(os.getenv('MR_ITEMS_PER_CHUNK', '16'))
     results_key: str = 'map-reduce/final-results'
+    balance_sample_rate: float = float(os.getenv('MR_BALANCE_SAMPLE_RATE', '0.01'))
 
     def validate(self) -> None:
         """Validate task configuration."""
@@ -73,13 +91,17 @@ class TaskConfig:
             raise ConfigError(f"Invalid max task timeout: {self.max_timeout}")
         if self.items_per_chunk < 1:
             raise ConfigError(f"Invalid items per chunk: {self.items_per_chunk}")
+        if not 0 < self.balance_sample_rate <= 1:
+            raise ConfigError(f"Invalid balance sample rate: {self.balance_sample_rate}")
 
-@dataclass
+@dataclass(frozen=True)
 class NameServerConfig:
     """Nameserver configuration."""
     contest_interval: float = float(os.getenv('MR_NS_CONTEST_INTERVAL', '0.01'))
     backup_interval: float = float(os.getenv('MR_NS_BACKUP_INTERVAL', '5.0'))
     backup_key: str = 'ns/backup'
+    enable_broadcast: bool = os.getenv('MR_NS_ENABLE_BROADCAST', 'true').lower() in ('1', 'true', 'yes')
+    hosts: tuple = tuple(host for host in os.getenv('MR_NS_HOSTS', '').split(',') if host)
 
     def validate(self) -> None:
         """Validate nameserver configuration."""
@@ -88,7 +110,7 @@ class NameServerConfig:
         if self.backup_interval <= 0:
             raise ConfigError(f"Invalid backup interval: {self.backup_interval}")
 
-@dataclass
+@dataclass(frozen=True)
 class NodeConfig:
     """Node configuration for master and follower nodes."""
     master_name: str = 'master'
@@ -97,8 +119,12 @@ class NodeConfig:
     master_data: str = 'master/staged/data'
     master_map_code: str = 'master/staged/map-code'
     master_reduce_code: str = 'master/staged/reduce-code'
+    master_combine_code: str = 'master/staged/combine-code'
+    master_balance: str = 'master/staged/balance'
+    master_token: str = 'master/staged/token'
     master_backup_key: str = 'master/backup'
     master_backup_interval: float = float(os.getenv('MR_MASTER_BACKUP_INTERVAL', '2.0'))
+    share_input: bool = os.getenv('MR_SHARE_INPUT', 'false').lower() in ('1', 'true', 'yes')
 
     def validate(self) -> None:
         """Validate node configuration."""
@@ -159,12 +185,14 @@ try:
 except ValueError as e:
     raise ConfigError(f"Configuration error: {str(e)}")
 
-# Export commonly used values as module-level constants
-IP = network.ip
+# Export commonly used values as module-level constants. The IP address is resolved
+# lazily through `get_ip` instead, as looking it up blocks on a network route.
 DAEMON_PORT = network.daemon_port
 BROADCAST_PORT = network.broadcast_port
 REQUEST_TIMEOUT = network.request_timeout
 REQUEST_RETRIES = network.request_retries
+THREADPOOL_SIZE_MIN = network.threadpool_size_min
+PROXY_POOL_SIZE = network.proxy_pool_size
 
 DHT_NAME = dht.name
 DHT_SERVICE_NAME = dht.service_name
@@ -176,10 +204,13 @@ DHT_REPLICATION_SIZE = dht.replication_size
 MAX_TASK_TIMEOUT = task.max_timeout
 ITEMS_PER_CHUNK = task.items_per_chunk
 RESULTS_KEY = task.results_key
+BALANCE_SAMPLE_RATE = task.balance_sample_rate
 
 NS_CONTEST_INTERVAL = nameserver.contest_interval
 NS_BACKUP_INTERVAL = nameserver.backup_interval
 NS_BACKUP_KEY = nameserver.backup_key
+NS_ENABLE_BROADCAST = nameserver.enable_broadcast
+NS_HOSTS = nameserver.hosts
 
 MASTER_NAME = node.master_name
 FOLLOWER_NAME = node.follower_name
@@ -187,5 +218,13 @@ RQ_HANDLER_NAME = node.request_handler_name
 MASTER_DATA = node.master_data
 MASTER_MAP_CODE = node.master_map_code
 MASTER_REDUCE_CODE = node.master_reduce_code
+MASTER_COMBINE_CODE = node.master_combine_code
+MASTER_BALANCE = node.master_balance
+MASTER_TOKEN = node.master_token
 MASTER_BACKUP_KEY = node.master_backup_key
 MASTER_BACKUP_INTERVAL = node.master_backup_interval
+SHARE_INPUT = node.share_input
+
+# Read-only view of all the constants above.
+CONFIG = MappingProxyType({ name: value for name, value in globals().items()
+                            if name.isupper() })
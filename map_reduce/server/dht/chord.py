@@ -14,7 +14,7 @@ from Pyro4.errors import CommunicationError, NamingError
 from map_reduce.server.configs import ( DHT_FINGER_TABLE_SIZE, DHT_STABILIZATION_INTERVAL,
                                         DHT_NAME, DHT_REPLICATION_SIZE )
 from map_reduce.server.utils import ( id, in_arc, reachable, SHA1_BIT_COUNT, spawn_thread,
-                                      service_address )
+                                      locate_ns, service_address )
 from map_reduce.server.logger import get_logger
 logger = get_logger('dht', extras=True)
 
@@ -238,7 +238,7 @@ class ChordNode:
 
     def _check_ring_availability(self):
         ''' Check periodically for the ring in the nameserver. '''
-        with Pyro4.locateNS() as ns:
+        with locate_ns() as ns:
             try:
                 ring = ns.lookup(DHT_NAME)
                 if ring != self.address and ring != self._ring:
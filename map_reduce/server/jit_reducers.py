@@ -0,0 +1,89 @@
+"""
+Compiled reducers and map drivers for numeric map-reduce jobs.
+
+Functions marked as `jit_friendly` promise to be numba compatible. Marked reduce
+functions are compiled and fed their numeric values as an array, while marked map
+functions are driven over whole chunks by a compiled loop. numba is an optional
+dependency, without it (or whenever numba refuses a function) marked functions run
+as plain Python.
+"""
+from array import array
+from functools import lru_cache
+from typing import Callable
+from weakref import WeakSet
+
+try:
+    import numpy as np
+    from numba import njit
+    from numba.typed import List
+except ImportError:
+    np = njit = List = None
+
+# Functions numba failed to compile, these are not attempted again.
+_refused_mappers = WeakSet()
+_refused_reducers = WeakSet()
+
+
+def jit_friendly(func: Callable) -> Callable:
+    ''' Marks a map or reduce function as numba compatible. '''
+    func.__jit_friendly__ = True
+    return func
+
+@lru_cache(maxsize=16)
+def _compiled_reducer(func: Callable) -> Callable:
+    ''' Compiles a reduce function, types are resolved on its first call. '''
+    return njit(func)
+
+def jit_reducer(func: Callable) -> Callable:
+    '''
+    Returns a compiled version of a `jit_friendly` reduce function, or the function
+    itself if it is not marked or numba is not available. Values which are not
+    numeric, and functions numba refuses, are reduced in plain Python.
+    '''
+    if njit is None or not getattr(func, '__jit_friendly__', False):
+        return func
+    if func in _refused_reducers:
+        return func
+
+    def reducer(key, values):
+        if func in _refused_reducers:
+            return func(key, values)
+        arr = np.asarray(values)
+        if arr.ndim != 1 or arr.dtype.kind not in 'iuf':
+            return func(key, values)
+        try:
+            result = _compiled_reducer(func)(key, arr)
+        except Exception:
+            _refused_reducers.add(func)
+            return func(key, values)
+        return result.item() if isinstance(result, np.generic) else result
+    return reducer
+
+@lru_cache(maxsize=16)
+def _map_driver(func: Callable) -> Callable:
+    ''' Builds a compiled loop applying `func` to every shard of a chunk. '''
+    compiled = njit(func)
+
+    @njit
+    def drive(task_id, shards):
+        out = []
+        for shard in shards:
+            out.extend(compiled(task_id, shard))
+        return out
+    return drive
+
+def jit_map(func: Callable, task_id, shards: list) -> list:
+    '''
+    Maps a `jit_friendly` function over a chunk with a compiled loop. Returns None
+    if the function is not marked, numba is not available or refuses to compile it,
+    in which case the chunk should be mapped in plain Python.
+    '''
+    if njit is None or not getattr(func, '__jit_friendly__', False):
+        return None
+    if func in _refused_mappers or not shards:
+        return None
+    try:
+        return _map_driver(func)(task_id, List(shards))
+    except Exception:
+        _refused_mappers.add(func)
+        return None
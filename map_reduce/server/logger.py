@@ -1,21 +1,55 @@
 """
 Structured logging configuration for all server components.
-Provides both console and file logging with rotation.
+Provides both console and file logging with rotation. Records are handed over
+to a queue, and written to their outputs by a background listener thread.
 """
+import atexit
+import functools
 import logging
 import logging.handlers
 import os
+import queue
 import sys
 from typing import Any, Dict, Optional
 
+import orjson
 import structlog
-from pythonjsonlogger import jsonlogger
 
 from map_reduce.server.configs import LOGGING, ConfigError
 
 # Default log directory
 LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
 
+# Attributes every log record has, anything else was passed as an extra.
+RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+# Queue between the logging threads and the listener writing to the outputs.
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, respect_handler_level=True)
+
+
+def orjson_dumps(obj: Any, **kwargs) -> str:
+    """JSON serializer for structlog's renderer, backed by orjson."""
+    return orjson.dumps(obj, default=kwargs.get("default", str)).decode()
+
+class OrjsonFormatter(logging.Formatter):
+    """Formats records as JSON objects, including any extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "asctime": self.formatTime(record),
+            "name": record.name,
+            "levelname": record.levelname,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(payload, default=str).decode()
+
+@functools.lru_cache(maxsize=None)
 def setup_logging(
     name: str,
     log_level: str = "INFO",
@@ -25,7 +59,8 @@ def setup_logging(
     json_format: bool = False,
 ) -> structlog.BoundLogger:
     """
-    Setup structured logging with both console and file handlers.
+    Setup structured logging with both console and file handlers. Memoized, so
+    each logger configuration is only set up once per process.
     
     Args:
         name: Logger name
@@ -45,12 +80,10 @@ def setup_logging(
         os.makedirs(LOG_DIR, exist_ok=True)
         log_file = os.path.join(LOG_DIR, f"{name}.log")
 
-    # Setup standard logging
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=getattr(logging, log_level.upper()),
-    )
+    # Setup standard logging, the first configured level applies to the root logger
+    root_logger = logging.getLogger()
+    if not root_logger.handlers:
+        root_logger.setLevel(getattr(logging, log_level.upper()))
 
     # Configure processors
     processors = [
@@ -63,7 +96,7 @@ def setup_logging(
     ]
 
     if json_format:
-        processors.append(structlog.processors.JSONRenderer())
+        processors.append(structlog.processors.JSONRenderer(serializer=orjson_dumps))
     else:
         processors.append(
             structlog.dev.ConsoleRenderer(
@@ -77,10 +110,9 @@ def setup_logging(
     
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
+    console_handler._mr_owner = 'console'
     if json_format:
-        formatter = jsonlogger.JsonFormatter(
-            fmt="%(asctime)s %(name)s %(levelname)s %(message)s"
-        )
+        formatter = OrjsonFormatter()
         console_handler.setFormatter(formatter)
     handlers.append(console_handler)
 
@@ -92,6 +124,7 @@ def setup_logging(
             backupCount=backup_count,
             encoding="utf-8",
         )
+        file_handler._mr_owner = log_file
         if json_format:
             file_handler.setFormatter(formatter)
         handlers.append(file_handler)
@@ -108,10 +141,19 @@ def setup_logging(
     # Get logger
     logger = structlog.get_logger(name)
 
-    # Add handlers to root logger
-    root_logger = logging.getLogger()
+    # Route the root logger through the queue, started on first setup
+    if not any(isinstance(h, logging.handlers.QueueHandler) for h in root_logger.handlers):
+        root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+
+    # Add handlers to the listener, skipping outputs that already have one
+    owners = { handler._mr_owner for handler in _log_listener.handlers }
     for handler in handlers:
-        root_logger.addHandler(handler)
+        if handler._mr_owner in owners:
+            handler.close()
+        else:
+            _log_listener.handlers += (handler,)
 
     return logger
 
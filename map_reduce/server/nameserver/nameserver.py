@@ -1,17 +1,17 @@
-import time
 import logging
-from threading import Thread
-from typing import Any, Callable, Union
+import random
+from threading import Event, Thread
+from typing import Any, Callable, Optional
 
 import Pyro4
 import Pyro4.errors
 import Pyro4.naming
 from Pyro4 import URI, Proxy
 from Pyro4.naming import NameServerDaemon, BroadcastServer
-from map_reduce.server.configs import ( DHT_SERVICE_NAME, NS_BACKUP_KEY,
-                                        NS_BACKUP_INTERVAL, NS_CONTEST_INTERVAL )
+from map_reduce.server.configs import ( DHT_SERVICE_NAME, NS_BACKUP_KEY, NS_BACKUP_INTERVAL,
+                                        NS_CONTEST_INTERVAL, NS_ENABLE_BROADCAST )
 from map_reduce.server.utils import ( reachable, id, kill_thread, spawn_thread,
-                                      daemon_address )
+                                      daemon_address, locate_ns )
 from map_reduce.server.logger import get_logger
 
 
@@ -33,7 +33,6 @@ class NameServer:
         # Self attributes.
         self._ip = ip
         self._port = port
-        self._alive = False
         self._uri: URI = None
         self._dht_address: URI = daemon_address(DHT_SERVICE_NAME)
 
@@ -45,15 +44,17 @@ class NameServer:
         self._on_startup_events = {}
         self._on_shutdown_events = {}
 
-        # Threads.
+        # Threads, loops stop cooperatively once their stop event is set.
+        self._stop_evt = Event()
+        self._stop_evt.set()
+        self._ns_stop_evt = Event()
         self._ns_thread: Thread = None
         self._broadcast_thread: Thread = None
         self._ns_backup_thread: Thread = None
         self._stabilization_thread: Thread = None
 
-        # Logger config.
-        global logger
-        logger = logging.LoggerAdapter(logger, {'IP': ip})
+        # Logger config, tagged with this machine's address.
+        self._log = logging.LoggerAdapter(logger, {'IP': ip})
         
     def __str__(self):
         status = 'remote' if self.is_remote else 'local'
@@ -62,6 +63,10 @@ class NameServer:
     def __repr__(self):
         return str(self)
     
+    @property
+    def _alive(self) -> bool:
+        return not self._stop_evt.is_set()
+
     @property
     def is_remote(self) -> bool:
         return self._ip != self._uri.host
@@ -74,30 +79,40 @@ class NameServer:
     def servers(self) -> tuple[Pyro4.Daemon, Pyro4.naming.BroadcastServer]:
         return self._ns_daemon, self._ns_broadcast
     
-    def _locate_nameserver(self) -> Union[URI, None]:
+    def _locate_nameserver(self) -> tuple[Optional[URI], bool]:
         '''
-        Attempts to locate a remote nameserver. Returns its URI if found.
+        Attempts to locate a nameserver. Returns its URI if found, and whether the
+        current nameserver is reachable. Locating the current nameserver proves it
+        reachable, so it is only probed separately when a remote one went missing.
         '''
         try:
-            with Pyro4.locateNS() as ns:
-                return ns._pyroUri
+            with locate_ns() as ns:
+                found = ns._pyroUri
         except (Pyro4.errors.NamingError, PermissionError):
-            return None
+            found = None
+        if self._uri is None:
+            return found, False
+        if found == self._uri or self.is_local:
+            return found, True
+        return found, reachable(self._uri)
     
     def _start_local_nameserver(self):
         '''
-        Starts the local nameserver on a parallel thread.
+        Starts the local nameserver on a parallel thread. Its broadcast server is
+        only started if broadcast discovery is enabled.
         '''
-        logger.info(f'Local nameserver started.')
-        self._uri, self._ns_daemon, self._ns_broadcast = Pyro4.naming.startNS(self._ip,
-                                                                              self._port)
+        self._log.info(f'Local nameserver started.')
+        self._ns_stop_evt.clear()
+        self._uri, self._ns_daemon, self._ns_broadcast = Pyro4.naming.startNS(
+            self._ip, self._port, enableBroadcast=NS_ENABLE_BROADCAST)
         self._ns_thread = spawn_thread(target=self._ns_daemon.requestLoop)
-        self._broadcast_thread = spawn_thread(target=self._ns_broadcast.runInThread)
+        if self._ns_broadcast is not None:
+            self._broadcast_thread = spawn_thread(target=self._ns_broadcast.runInThread)
 
         # Read backup data from DHT if available.
-        logger.debug(f'Attempting to read nameserver data from DHT.')
+        self._log.debug(f'Attempting to read nameserver data from DHT.')
         if reachable(self._dht_address):
-            logger.debug(f'DHT is reachable.')
+            self._log.debug(f'DHT is reachable.')
             with Proxy(self._dht_address) as dht:
                 if ns_data := dht.lookup(NS_BACKUP_KEY):
                     if isinstance(ns_data, dict):
@@ -105,23 +120,23 @@ class NameServer:
                             try:
                                 self._ns_daemon.nameserver.register(name, addr, safe=True)
                             except Pyro4.errors.NamingError as e:
-                                logger.debug(f'{e}')
+                                self._log.debug(f'{e}')
                                 continue
-                        logger.info(f'Staged data from DHT loaded.')
+                        self._log.info(f'Staged data from DHT loaded.')
                     else:
-                        logger.error(f'Error extracting backup from DHT: backup={ns_data}.')
+                        self._log.error(f'Error extracting backup from DHT: backup={ns_data}.')
 
         # Callback delegation.
         for addr, callback in self._on_startup_events.items():
-            logger.info(f'Calling startup on {addr.object}')
+            self._log.info(f'Calling startup on {addr.object}')
             self._ns_daemon.nameserver.register(addr.object, addr)
             callback()
 
         # Start backup thread.
         def nameserver_backup_loop():
-            while True:
+            while not self._ns_stop_evt.is_set():
                 self._backup_nameserver()
-                time.sleep(NS_BACKUP_INTERVAL)
+                self._ns_stop_evt.wait(NS_BACKUP_INTERVAL)
 
         self._ns_backup_thread = spawn_thread(target=nameserver_backup_loop)
 
@@ -133,7 +148,7 @@ class NameServer:
             with Proxy(self._dht_address) as dht:
                 if self._ns_daemon is not None and self._ns_daemon.nameserver is not None:
                     dht.insert(NS_BACKUP_KEY, self._ns_daemon.nameserver.list())
-                    logger.debug(f'Nameserver data backed up to DHT.')
+                    self._log.debug(f'Nameserver data backed up to DHT.')
                 # TODO: Maybe integrate delegate backups as well.
         
 
@@ -142,42 +157,50 @@ class NameServer:
         Stops the local nameserver (killing its thread and daemons).
         '''
         if forward_to is not None:
-            # Forward registered objects to new nameserver.
+            # Forward registered objects to new nameserver. Names it already has are
+            # skipped, the rest are registered in a single batched round-trip, since
+            # a failing call would abort the remainder of the batch.
             new_ns = forward_to
             try:
                 sender = self._ns_daemon.nameserver
                 with Proxy(new_ns) as receiver:
+                    known = receiver.list()
+                    batch = Pyro4.batch(receiver)
                     for name, addr in sender.list().items():
-                        try:
-                            receiver.register(name, addr, safe=True)
-                        except Pyro4.errors.NamingError as e:
-                            logger.debug(f'{e}')
-                            continue
+                        if name not in known:
+                            batch.register(name, addr, safe=True)
+                    try:
+                        for _ in batch():
+                            pass
+                    except Pyro4.errors.NamingError as e:
+                        self._log.debug(f'{e}')
             except Exception as e:
-                logger.error(f"Error forwarding registry to nameserver {new_ns.host!r}: {e}")
+                self._log.error(f"Error forwarding registry to nameserver {new_ns.host!r}: {e}")
             
             # Overwrite the binding address.
             self._uri = new_ns
 
         # Callback delegation.
         for addr, callback in self._on_shutdown_events.items():
-            logger.info(f'Calling shutdown on {addr.object}')
+            self._log.info(f'Calling shutdown on {addr.object}')
             callback()
 
         # Shutdown the backup task.
-        kill_thread(self._ns_backup_thread, logger)
+        self._ns_stop_evt.set()
+        kill_thread(self._ns_backup_thread, self._log)
 
-        # Shutdown the nameserver.
+        # Shutdown the nameserver, which unblocks its request loop.
         self._ns_daemon.shutdown()
         self._ns_daemon = None
-        kill_thread(self._ns_thread, logger)
+        kill_thread(self._ns_thread, self._log)
         
-        # Shutdown the broadcast utility server.
-        self._ns_broadcast.close()
-        self._ns_broadcast = None
-        kill_thread(self._broadcast_thread, logger)
+        # Shutdown the broadcast utility server, closing it unblocks its select loop.
+        if self._ns_broadcast is not None:
+            self._ns_broadcast.close()
+            self._ns_broadcast = None
+            kill_thread(self._broadcast_thread, self._log)
         
-        logger.info(f'Local nameserver stopped.')
+        self._log.info(f'Local nameserver stopped.')
     
     # Leader election.
     def _refresh_nameserver(self):
@@ -191,25 +214,25 @@ class NameServer:
         externally when sequential checks are needed instead of a parallel thread.
         '''
         curr_ns = self._uri
-        new_ns = self._locate_nameserver()
+        new_ns, curr_reachable = self._locate_nameserver()
 
         if self.is_remote:
-            if not reachable(curr_ns):
-                logger.warning(f'Remote nameserver @{curr_ns.host} is not reachable.')
+            if not curr_reachable:
+                self._log.warning(f'Remote nameserver @{curr_ns.host} is not reachable.')
                 if new_ns is not None:
-                    logger.info(f'Found new nameserver @{new_ns.host}.')
+                    self._log.info(f'Found new nameserver @{new_ns.host}.')
                     self._uri = new_ns
                 else:
-                    logger.info(f'No new nameserver found. Announcing self.')
+                    self._log.info(f'No new nameserver found. Announcing self.')
                     self._start_local_nameserver()
         else:
             if new_ns is not None and new_ns != curr_ns:
-                logger.info(f'Found contesting nameserver @{new_ns.host}.')
+                self._log.info(f'Found contesting nameserver @{new_ns.host}.')
                 if id(curr_ns) >= id(new_ns):
-                    logger.info(f'I no longer am the nameserver, long live {new_ns.host}.')
+                    self._log.info(f'I no longer am the nameserver, long live {new_ns.host}.')
                     self._stop_local_nameserver(forward_to=new_ns)
                 else:
-                    logger.debug(f'I am still the nameserver.')
+                    self._log.debug(f'I am still the nameserver.')
 
     # Main API.
     def start(self):
@@ -220,18 +243,19 @@ class NameServer:
         self._start_local_nameserver()
 
         def nameserver_loop():
-            self._alive = True
+            # Intervals are jittered by 20% so nodes don't contest in lockstep.
             while self._alive:
                 self._refresh_nameserver()
-                time.sleep(NS_CONTEST_INTERVAL)
+                self._stop_evt.wait(NS_CONTEST_INTERVAL * random.uniform(0.8, 1.2))
 
-        logger.info('Nameserver checker loop starting...')
+        self._stop_evt.clear()
+        self._log.info('Nameserver checker loop starting...')
         self._stabilization_thread = spawn_thread(target=nameserver_loop)
     
     def stop(self):
         ''' Stops the nameserver wrapper and the created threads. '''
-        self._alive = False
-        kill_thread(self._stabilization_thread, logger)
+        self._stop_evt.set()
+        kill_thread(self._stabilization_thread, self._log)
         if self.is_local:
             self._stop_local_nameserver()
 
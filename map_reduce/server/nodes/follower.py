@@ -6,8 +6,11 @@ from typing import Any, Callable, List
 from Pyro4 import Proxy, URI
 from map_reduce.server.configs import MASTER_NAME
 
+from map_reduce.server.jit_reducers import jit_map, jit_reducer
 from map_reduce.server.logger import get_logger
-from map_reduce.server.utils import ( kill_thread, spawn_thread )
+from map_reduce.server.shared_input import SharedChunk, read_shared
+from map_reduce.server.utils import ( Partition, combine, deserialize_function,
+                                      kill_thread, lines_from, locate_ns, spawn_thread )
 
 logger = get_logger('flwr')
 
@@ -23,6 +26,8 @@ class Follower:
         self._task_type = None
         self._task_result = None
         self._task_function = None
+        self._task_tag = None
+        self._task_combiner = None
         
         self._task_lock = Lock()
         self._task_thread: Thread = None
@@ -34,24 +39,25 @@ class Follower:
 
     # Exposed RPCs.
     @Pyro4.oneway
-    def map(self, task_id: str, task_chunk: list[Any], func):
-        ''' Map function over data chunk. '''
+    def map(self, task_id: str, task_chunk: list[Any], func, combiner=None, tag=None):
+        '''
+        Map function over data chunk, folding the output with `combiner` if given.
+        The function's `tag` is reported back in its place.
+        '''
         logger.info(f'Received map chunk {task_id!r} of size {len(task_chunk)}')
-        self._acknowledge_task(task_id, task_chunk, func, 'map')
+        self._acknowledge_task(task_id, task_chunk, func, 'map', combiner, tag)
     
     @Pyro4.oneway
-    def reduce(self, task_id: str, task_group: list[Any], func):
-        ''' Apply reduce function on data group. '''
+    def reduce(self, task_id: str, task_group: list[Any], func, tag=None):
+        ''' Apply reduce function on data group. The function's `tag` is reported back. '''
         logger.info(f'Received reduce task {task_id!r}')
-        self._acknowledge_task(task_id, task_group, func, 'reduce')
+        self._acknowledge_task(task_id, task_group, func, 'reduce', tag=tag)
 
 
     # Helper methods.
-    def _acknowledge_task(self, task_id, task_data, func, ttype):
+    def _acknowledge_task(self, task_id, task_data, func, ttype, combiner=None, tag=None):
         ''' Internally acknowledge the map/reduce task. '''
-        # Stop doing previous task.
-        if self._task_lock.locked():
-            self._task_lock.release()
+        # Let the previous task finish, the lock is only ever released by its owner.
         if self._task_thread:
             kill_thread(self._task_thread)
 
@@ -61,6 +67,8 @@ class Follower:
             self._task_id = task_id
             self._task_data = task_data
             self._task_function = func
+            self._task_combiner = combiner
+            self._task_tag = tag
             self._task_result = None
         
         # Do task on thread.
@@ -71,25 +79,46 @@ class Follower:
         assert self._task_type in ['map', 'reduce'], "Request type must be 'map' or 'reduce'."
 
         with self._task_lock:
+            # Functions arrive serialized, the loaded callables are cached across tasks.
+            function = deserialize_function(self._task_function)
             if self._task_type == 'map':
-                self._task_result = []
-                for shard in self._task_data:
-                    partial = self._task_function(self._task_id, shard)
-                    if not hasattr(partial, '__iter__'):
-                        raise ValueError('Map function return type must be at least iterable.')
-                    self._task_result.extend(partial)
+                chunk = self._task_data
+                if isinstance(chunk, SharedChunk):
+                    chunk = read_shared(chunk)
+                shards = lines_from(chunk)
+                if getattr(function, '__vectorizable__', False):
+                    self._task_result = list(function(self._task_id, shards))
+                else:
+                    self._task_result = jit_map(function, self._task_id, shards)
+                if self._task_result is None:
+                    self._task_result = []
+                    for shard in shards:
+                        partial = function(self._task_id, shard)
+                        if not hasattr(partial, '__iter__'):
+                            raise ValueError('Map function return type must be at least iterable.')
+                        self._task_result.extend(partial)
+                if self._task_combiner is not None:
+                    combiner = deserialize_function(self._task_combiner)
+                    self._task_result = combine(self._task_result, combiner)
             else:
-                self._task_result = self._task_function(self._task_id, self._task_data)
+                reducer = jit_reducer(function)
+                if isinstance(self._task_data, Partition):
+                    self._task_result = { key: reducer(key, values)
+                                          for key, values in self._task_data.items() }
+                else:
+                    self._task_result = reducer(self._task_id, self._task_data)
             logger.info(f'Completed {self._task_type} task {self._task_id!r}.')
-            if self._task_result is not None:
-                with Pyro4.locateNS() as ns:
-                    with Proxy(ns.lookup(MASTER_NAME)) as master:
-                        master.report_task(self._address,
-                                           self._task_id,
-                                           self._task_function,
-                                           self._task_result)
-            else:
-                logger.error('Task errored, results were None.')
+            task_id = self._task_id
+            task_tag = self._task_tag or self._task_function
+            result = self._task_result
+
+        # Report outside the lock, so a new task is never held up by the master.
+        if result is not None:
+            with locate_ns() as ns:
+                with Proxy(ns.lookup(MASTER_NAME)) as master:
+                    master.report_task(self._address, task_id, task_tag, result)
+        else:
+            logger.error('Task errored, results were None.')
 
     def _announce_to_master_loop(self):
         '''
@@ -97,7 +126,7 @@ class Follower:
         '''
         while True:
             try:
-                with Pyro4.locateNS() as ns:
+                with locate_ns() as ns:
                     with Proxy(ns.lookup(MASTER_NAME)) as master:
                         master.subscribe(self._address)
                         break
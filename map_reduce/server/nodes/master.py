@@ -1,26 +1,55 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+import itertools
 from logging import LoggerAdapter
+import pickle
 import time
-from threading import Lock, Thread
-from typing import Any
+from threading import Event, Lock, Thread
+from typing import Any, Optional
 
 import Pyro4
 import Pyro4.errors
 from Pyro4 import Proxy, URI
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from map_reduce.server.configs import ( DHT_NAME, MASTER_DATA, MASTER_BACKUP_KEY,
-                                        MASTER_MAP_CODE, MASTER_REDUCE_CODE,
-                                        REQUEST_TIMEOUT, MASTER_BACKUP_INTERVAL, RESULTS_KEY, RQ_HANDLER_NAME )
-from map_reduce.server.utils import ( reachable, service_address, spawn_thread,
-                                      kill_thread )
+                                        MASTER_MAP_CODE, MASTER_REDUCE_CODE, MASTER_COMBINE_CODE,
+                                        MASTER_BALANCE, PROXY_POOL_SIZE,
+                                        REQUEST_TIMEOUT, MASTER_BACKUP_INTERVAL, RESULTS_KEY, RQ_HANDLER_NAME,
+                                        SHARE_INPUT )
+from map_reduce.server.utils import ( Partition, append_value, function_tag, locate_ns,
+                                      reachable, sample_partitions, service_address,
+                                      spawn_thread, kill_thread )
+from map_reduce.server.shared_input import SharedInput
 from map_reduce.server.logger import get_logger
 logger = get_logger('mstr')
 
+# First delay between polls for a request, doubled up to REQUEST_TIMEOUT.
+REQUEST_BACKOFF_MIN = 0.05
+# Most blocking calls, mostly task RPCs, the event loop runs in parallel.
+MAX_DISPATCH_WORKERS = 32
+# Stripes of intermediate reduce values, must be a power of two.
+REDUCE_STRIPES = 16
+# Seconds a follower is trusted to be alive after it was last heard from.
+LIVENESS_TTL = 0.5
+# Marks a task missing from a container, tasks themselves may be falsy.
+_MISSING = object()
+
 
 class TaskGroup:
-    def __init__(self, pending = {}, assigned = {}, completed = {}):
-        self.pending: dict = pending
-        self.assigned: dict = assigned
-        self.completed: dict = completed
+    def __init__(self, pending: dict = None, assigned: dict = None, completed: dict = None):
+        # Every group owns its containers, default dicts must not be shared. Pending
+        # tasks are kept in submission order and handed out first in, first out.
+        self.pending: OrderedDict = OrderedDict(pending or ())
+        self.assigned: dict = assigned if assigned is not None else {}
+        self.completed: dict = completed if completed is not None else {}
     
     @property
     def any(self):
@@ -32,17 +61,22 @@ class TaskGroup:
     
     def set_as_complete(self, task_id):
         '''
-        Searches for a task by id in the pending or assigned sections, then flags
-        it as completed.
+        Searches for a task by id in the assigned or pending sections, then flags
+        it as completed. Reported tasks are normally assigned, so that is the only
+        lookup made in the common case.
         '''
-        for container in [self.pending, self.assigned]:
-            if task_id in container:
-                task = container.pop(task_id)
-                self.completed[task_id] = task
-                return True
-        else:
+        task = self.assigned.pop(task_id, _MISSING)
+        if task is _MISSING:
+            task = self.pending.pop(task_id, _MISSING)
+        if task is _MISSING:
             logger.error(f"Set task {task_id} as complete but couldn't find it")
             return False
+        self.completed[task_id] = task
+        return True
+
+    def pop_pending(self) -> tuple:
+        ''' Pops the oldest pending task as a `(task_id, task)` pair. '''
+        return self.pending.popitem(last=False)
 
     def reset(self):
         ''' Resets data to default. '''
@@ -58,11 +92,16 @@ class TaskGroup:
     def dump(self):
         ''' Returns data in tuple form. '''
         return (self.pending, self.assigned, self.completed)
+
+    def snapshot(self):
+        ''' Returns shallow copies of the data in tuple form, see `dump`. '''
+        return (self.pending.copy(), self.assigned.copy(), self.completed.copy())
     
     def load(self, ts: tuple):
         ''' Instances a new TaskGroup in tuple form. '''
         assert len(ts) == 3, 'Provided tuple must contain pending, assigned and completed tasks.'
-        self.pending, self.assigned, self.completed = ts
+        pending, self.assigned, self.completed = ts
+        self.pending = OrderedDict(pending)
 
 
 @Pyro4.expose
@@ -78,9 +117,10 @@ class Master:
         # Basic attribs.
         self._address = address
         
-        # Tasking and followers.
+        # Tasking and followers. All known followers, busy or idle, are kept as well.
         self._followers = set()
         self._idle_followers = set()
+        self._all_followers = set()
         self._map_tasks = TaskGroup()
         self._reduce_tasks = TaskGroup()
         self._results = {}
@@ -91,48 +131,178 @@ class Master:
         self._reduce_tasks_lock = Lock()
         self._results_lock = Lock()
 
-        # Map/reduce functions, these stay serialized.
+        # Intermediate values reported during the map phase, striped by key hash so
+        # concurrent reports only contend on colliding stripes.
+        self._reduce_stripes = [ {} for _ in range(REDUCE_STRIPES) ]
+        self._reduce_stripe_locks = [ Lock() for _ in range(REDUCE_STRIPES) ]
+
+        # Set whenever a follower subscribes or reports, wakes up the master loop.
+        self._work_evt = Event()
+
+        # Bumped on every change of the backed up state, unchanged states aren't sent.
+        self._versions = itertools.count(1)
+        self._state_version = 0
+
+        # Runs the blocking calls of the event loop, such as task RPCs. Created on
+        # every start, since a stopped pool can not take new work.
+        self._dispatch_pool: Optional[ThreadPoolExecutor] = None
+
+        # Map/reduce/combine functions, these stay serialized.
         self._map_function: bytes = None
         self._reduce_function: bytes = None
+        self._combine_function: bytes = None
+        self._balance: str = None
+
+        # Short fingerprints of the map/reduce functions, followers report these back.
+        self._map_tag: bytes = None
+        self._reduce_tag: bytes = None
 
-        # Threads.
-        self._alive = False
+        # Last known liveness of each follower, as `(alive, timestamp)`.
+        self._liveness: dict[URI, tuple[bool, float]] = {}
+
+        # Bound proxies reused across calls, least recently used first.
+        self._proxy_pool: OrderedDict[URI, Proxy] = OrderedDict()
+        self._proxy_pool_lock = Lock()
+        self._ns_uri: URI = None
+        self._dht_uri: URI = None
+
+        # Raw map input shared with followers on this host.
+        self._shared_input: SharedInput = None
+
+        # The master and backup loops run as coroutines on an event loop owned by
+        # the master thread, and stop cooperatively once the stop event is set.
+        self._stop_evt = Event()
+        self._stop_evt.set()
         self._master_thread: Thread = None
-        self._backup_thread: Thread = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._loop_wakeup: asyncio.Event = None
+        self._backup_task: asyncio.Future = None
 
-        global logger
-        logger = LoggerAdapter(logger, {'IP': self._address.host})
+        # Logger tagged with this master's address.
+        self._log = LoggerAdapter(logger, {'IP': self._address.host})
 
 
     # Properties.
     @property
-    def _dht_service(self) -> Proxy:
-        ''' Returns a live proxy to the DHT service. '''
-        with Pyro4.locateNS() as ns:
-            return Proxy(service_address(ns.lookup(DHT_NAME)))
+    def _alive(self) -> bool:
+        ''' Whether the master is running, i.e. it was started and not stopped. '''
+        return not self._stop_evt.is_set()
+
+    @property
+    def _nameserver(self):
+        ''' Returns a pooled proxy to the nameserver, which is only located once. '''
+        if self._ns_uri is None:
+            with locate_ns() as ns:
+                self._ns_uri = ns._pyroUri
+        return self._pooled(self._ns_uri)
+
+    @property
+    def _dht_service(self):
+        ''' Returns a pooled proxy to the DHT service, which is only looked up once. '''
+        if self._dht_uri is None:
+            with self._nameserver as ns:
+                self._dht_uri = service_address(ns.lookup(DHT_NAME))
+        return self._pooled(self._dht_uri)
+
+
+    # Proxy pool.
+    def _get_proxy(self, uri: URI) -> Proxy:
+        '''
+        Returns a bound proxy to `uri`, reusing its connection across calls. Beyond
+        `PROXY_POOL_SIZE` proxies the least recently used one is released.
+        '''
+        with self._proxy_pool_lock:
+            proxy = self._proxy_pool.get(uri)
+            if proxy is not None:
+                self._proxy_pool.move_to_end(uri)
+                return proxy
+        proxy = Proxy(uri)
+        proxy._pyroBind()
+        with self._proxy_pool_lock:
+            if uri in self._proxy_pool:
+                proxy._pyroRelease()
+                return self._proxy_pool[uri]
+            self._proxy_pool[uri] = proxy
+            evicted = []
+            while len(self._proxy_pool) > PROXY_POOL_SIZE:
+                evicted.append(self._proxy_pool.popitem(last=False)[1])
+        for old in evicted:
+            old._pyroRelease()
+        return proxy
+
+    def _drop_proxy(self, uri: URI):
+        ''' Releases the pooled proxy to `uri`, and forgets it if it was the NS or DHT. '''
+        with self._proxy_pool_lock:
+            proxy = self._proxy_pool.pop(uri, None)
+        if proxy is not None:
+            proxy._pyroRelease()
+        if uri == self._ns_uri:
+            self._ns_uri = None
+        if uri == self._dht_uri:
+            self._dht_uri = None
+
+    @contextmanager
+    def _pooled(self, uri: URI):
+        '''
+        Yields the pooled proxy to `uri`. Its connection is kept open afterwards,
+        unless a communication error was raised through it.
+        '''
+        try:
+            proxy = self._get_proxy(uri)
+            yield proxy
+        except Pyro4.errors.CommunicationError:
+            self._drop_proxy(uri)
+            raise
+
+    def _release_proxies(self):
+        ''' Releases every pooled proxy. '''
+        with self._proxy_pool_lock:
+            proxies = list(self._proxy_pool.values())
+            self._proxy_pool.clear()
+        for proxy in proxies:
+            proxy._pyroRelease()
+        self._ns_uri = self._dht_uri = None
 
 
     # DHT layer.
-    def _get_serialized_functions(self) -> tuple[bytes, bytes]:
+    def _dht_call(self, method: str, *args) -> Any:
+        '''
+        Calls a method of the DHT service through its cached proxy. If the proxy
+        fails, it is dropped along with the DHT address, which is looked up again
+        through the cached nameserver before retrying once.
+        '''
         try:
             with self._dht_service as dht:
-                map_serialized = dht.lookup(MASTER_MAP_CODE)
-                reduce_serialized = dht.lookup(MASTER_REDUCE_CODE)
+                return getattr(dht, method)(*args)
+        except Pyro4.errors.CommunicationError:
+            with self._dht_service as dht:
+                return getattr(dht, method)(*args)
+
+    def _get_serialized_functions(self) -> tuple[bytes, bytes, bytes]:
+        ''' Returns the staged map, reduce and (optional) combine functions. '''
+        try:
+            map_serialized = self._dht_call('lookup', MASTER_MAP_CODE)
+            reduce_serialized = self._dht_call('lookup', MASTER_REDUCE_CODE)
+            combine_serialized = self._dht_call('lookup', MASTER_COMBINE_CODE)
             if map_serialized is None or reduce_serialized is None:
                 return None
             else:
-                return (map_serialized, reduce_serialized)
+                # An empty combine code stands for no combiner.
+                return (map_serialized, reduce_serialized, combine_serialized or None)
         except Pyro4.errors.CommunicationError:
             return None
 
+    def _get_balance(self) -> str:
+        ''' Returns the staged balance strategy for reduce keys. '''
+        return self._dht_call('lookup', MASTER_BALANCE, 'none')
+
     def _get_request_data(self) -> dict:
-        with self._dht_service as dht:
-            return dht.lookup(MASTER_DATA)
+        return self._dht_call('lookup', MASTER_DATA)
     
     def _get_backup(self):
         ''' Loads data from backup if available. '''
-        with self._dht_service as dht:
-            return dht.lookup(MASTER_BACKUP_KEY)
+        backup = self._dht_call('lookup', MASTER_BACKUP_KEY)
+        return pickle.loads(backup) if isinstance(backup, bytes) else backup
 
 
     # Exposed RPCs.
@@ -140,38 +310,57 @@ class Master:
         '''
         Subscribes a follower to the master.
         '''
-        self._idle_followers.add(follower_address)
-        logger.info(f'{follower_address!s} subscribed to master.')
+        with self._followers_lock:
+            self._idle_followers.add(follower_address)
+            self._all_followers.add(follower_address)
+        self._state_version = next(self._versions)
+        self._work_evt.set()
+        self._wake_loop()
+        self._log.info(f'{follower_address!s} subscribed to master.')
     
-    def report_task(self, follower: URI, task_id: int, task_func: bytes, result: Any):
+    def report_task(self, follower: URI, task_id: int, task_tag: bytes, result: Any):
         '''
-        RPC to report task completion from a remote follower.
+        RPC to report task completion from a remote follower. The task is told apart
+        by the tag of its function, see `function_tag`.
         '''
-        # Set follower to idle.
+        # Set follower to idle, a report proves it alive.
+        self._liveness[follower] = (True, time.monotonic())
         with self._followers_lock:
             if follower in self._followers:
                 self._followers.remove(follower)
                 self._idle_followers.add(follower)
             else:
                 idle = 'marked as idle' if follower in self._idle_followers else 'not found'
-                logger.error(f'Follower reported a task but was {idle}.')
+                self._log.error(f'Follower reported a task but was {idle}.')
         
         # Find the task's group and mark it as done.
-        if task_func == self._map_function:
-            # Get map result then group values by the result's key.
+        if task_tag == self._map_tag:
+            # Get map result then group values by the result's key, each stripe is
+            # locked once. The task is completed afterwards so no values are missed.
+            by_stripe = [ [] for _ in range(REDUCE_STRIPES) ]
+            for pair in result:
+                by_stripe[hash(pair[0]) & (REDUCE_STRIPES - 1)].append(pair)
+            for stripe, lock, pairs in zip(self._reduce_stripes, self._reduce_stripe_locks, by_stripe):
+                if pairs:
+                    with lock:
+                        for out_key, inter_val in pairs:
+                            append_value(stripe, out_key, inter_val)
             with self._map_tasks_lock:
                 self._map_tasks.set_as_complete(task_id)
-            with self._reduce_tasks_lock:
-                for out_key, inter_val in result:
-                    self._reduce_tasks.pending.setdefault(out_key, []).append(inter_val)
-        elif task_func == self._reduce_function:
+        elif task_tag == self._reduce_tag:
             # Get reduce results.
             with self._reduce_tasks_lock, self._results_lock:
                 self._reduce_tasks.set_as_complete(task_id)
-                out_key, out_vals = task_id, result
-                self._results[out_key] = (out_vals)
+                if isinstance(self._reduce_tasks.completed.get(task_id), Partition):
+                    self._results.update(result)
+                else:
+                    out_key, out_vals = task_id, result
+                    self._results[out_key] = (out_vals)
         else:
             raise ValueError('Received a task function that is not map or reduce.')
+        self._state_version = next(self._versions)
+        self._work_evt.set()
+        self._wake_loop()
 
     def start(self):
         '''
@@ -179,135 +368,370 @@ class Master:
         such as the nameserver.
         '''
         # Start the master task-routing loop.
-        logger.info('Started master.')
-        self._alive = True
-        self._master_thread = spawn_thread(self._master_loop)
+        self._log.info('Started master.')
+        self._stop_evt.clear()
+        self._dispatch_pool = ThreadPoolExecutor(max_workers=MAX_DISPATCH_WORKERS,
+                                                 thread_name_prefix='dispatch')
+        self._master_thread = spawn_thread(self._run_loop)
 
     def stop(self):
         '''
         Stops the master server. Useful for delegating the stop to other logic,
         such as the nameserver.
         '''
-        self._alive = False
+        self._stop_evt.set()
+        self._work_evt.set()
+        self._wake_loop()
         if self._master_thread and self._master_thread.is_alive():
-            kill_thread(self._master_thread, logger, name='master', timeout=10)
-        if self._backup_thread and self._backup_thread.is_alive():
-            kill_thread(self._backup_thread, logger, name='backup', timeout=10)
-        logger.info('Stopped master.')
+            kill_thread(self._master_thread, self._log, name='master', timeout=10)
+        if self._dispatch_pool is not None:
+            self._dispatch_pool.shutdown(wait=False)
+            self._dispatch_pool = None
+        self._release_map_input()
+        self._release_proxies()
+        self._log.info('Stopped master.')
+
+
+    # Event loop.
+    def _run_loop(self):
+        ''' Runs the master and backup loops on an event loop owned by this thread. '''
+        loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._run())
+        finally:
+            self._loop = None
+            loop.close()
+
+    async def _run(self):
+        ''' Runs the master loop, then stops the backup loop along with it. '''
+        self._loop_wakeup = asyncio.Event()
+        self._backup_task = None
+        try:
+            await self._master_loop()
+        except Exception:
+            self._log.exception('Master loop failed.')
+            raise
+        finally:
+            if self._backup_task is not None:
+                self._backup_task.cancel()
+                try:
+                    await self._backup_task
+                except asyncio.CancelledError:
+                    pass
+                except Exception:
+                    self._log.exception('Backup loop failed.')
+
+    def _wake_loop(self):
+        ''' Wakes up the coroutines waiting on thread events, from any thread. '''
+        loop, wakeup = self._loop, self._loop_wakeup
+        if loop is not None and wakeup is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass    # The loop was closed in the meantime.
+
+    async def _wait(self, event: Event, timeout: float) -> bool:
+        '''
+        Awaits a thread event for up to `timeout` seconds, returning early once the
+        master is stopped. Returns whether the event is set.
+        '''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not (event.is_set() or self._stop_evt.is_set()):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._loop_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._loop_wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return event.is_set()
+
+    def _call(self, func, *args) -> asyncio.Future:
+        ''' Runs a blocking call, such as a Pyro RPC, on the dispatch pool. '''
+        return asyncio.get_running_loop().run_in_executor(self._dispatch_pool,
+                                                          partial(func, *args))
 
 
     # Helper methods.
-    def _assign_task(self, tasks: TaskGroup, func: bytes) -> bool:
+    def _tasks_lock(self, tasks: TaskGroup) -> Lock:
+        ''' Returns the lock guarding the provided task group. '''
+        return self._map_tasks_lock if tasks is self._map_tasks else self._reduce_tasks_lock
+
+    async def _assign_task(self, tasks: TaskGroup, func: bytes) -> bool:
         '''
-        Assign any pending task from the provided group to any idle follower.
+        Assign as many pending tasks from the provided group as there are idle
+        followers. Pairs are made under the locks, the RPCs are issued after
+        releasing them, in parallel. Returns True if any task was dispatched.
         '''
-        with self._followers_lock, self._map_tasks_lock, self._reduce_tasks_lock:
-            if self._idle_followers:
+        batch = []
+        with self._followers_lock, self._tasks_lock(tasks):
+            while self._idle_followers and tasks.pending:
                 follower_addr = self._idle_followers.pop()
-                if reachable(follower_addr):
-                    with Proxy(follower_addr) as follower:
-                        if tasks.pending:
-                            task_id, data = tasks.pending.popitem()
-                            tasks.assigned[task_id] = data
-                            self._followers.add(follower_addr)
-                            if func == self._map_function:
-                                follower.map(task_id, data, func)
-                            else:
-                                follower.reduce(task_id, data, func)
-                            logger.info(f'Dispatched task {task_id} to follower {follower_addr.host}.')
-                            return True
-        return False
-
-    def _master_loop(self):
-        '''
-        Main loop of the master server.
+                task_id, data = tasks.pop_pending()
+                tasks.assigned[task_id] = data
+                self._followers.add(follower_addr)
+                batch.append((follower_addr, task_id, data))
+            if batch:
+                self._state_version = next(self._versions)
+
+        dispatched = await asyncio.gather(*[ self._call(self._dispatch, tasks, func, *job)
+                                             for job in batch ])
+        return any(dispatched)
+
+    def _is_live(self, uri: URI, ttl: float = LIVENESS_TTL) -> bool:
+        '''
+        Returns whether a follower is alive. Followers heard from within `ttl`
+        seconds are trusted, others are probed once and the outcome is cached.
+        '''
+        alive, timestamp = self._liveness.get(uri, (False, 0.0))
+        if time.monotonic() - timestamp < ttl:
+            return alive
+        alive = reachable(uri)
+        self._liveness[uri] = (alive, time.monotonic())
+        return alive
+
+    def _dispatch(self, tasks: TaskGroup, func: bytes, follower_addr: URI, task_id, data) -> bool:
+        '''
+        Sends an assigned task to its follower. Unreachable followers are dropped,
+        and their task is put back as pending.
+        '''
+        try:
+            if not self._is_live(follower_addr):
+                raise Pyro4.errors.CommunicationError('follower did not answer')
+            with self._pooled(follower_addr) as follower:
+                if tasks is self._map_tasks:
+                    # Colocated followers read their chunk from shared memory.
+                    if self._shared_input and follower_addr.host == self._address.host:
+                        data = self._shared_input.get(task_id) or data
+                    follower.map(task_id, data, func, self._combine_function, self._map_tag)
+                else:
+                    follower.reduce(task_id, data, func, self._reduce_tag)
+            self._liveness[follower_addr] = (True, time.monotonic())
+            self._log.info(f'Dispatched task {task_id} to follower {follower_addr.host}.')
+            return True
+        except Pyro4.errors.CommunicationError:
+            self._log.info(f'Follower {follower_addr.host} is unreachable.')
+            self._liveness[follower_addr] = (False, time.monotonic())
+            self._drop_proxy(follower_addr)
+            with self._followers_lock, self._tasks_lock(tasks):
+                self._followers.discard(follower_addr)
+                self._all_followers.discard(follower_addr)
+                if task_id in tasks.assigned:
+                    tasks.pending[task_id] = tasks.assigned.pop(task_id)
+                self._state_version = next(self._versions)
+            return False
+
+    async def _await_work(self, tasks: TaskGroup, func: bytes):
+        '''
+        Assigns a task from the group, or otherwise waits until a follower subscribes
+        or reports. The wait is still bounded by REQUEST_TIMEOUT to catch lost followers.
+        '''
+        self._work_evt.clear()
+        if not await self._assign_task(tasks, func):
+            await self._wait(self._work_evt, REQUEST_TIMEOUT)
+
+    def _share_map_input(self):
+        '''
+        Packs the pending raw map chunks into shared memory, so followers on this
+        host don't receive a copy of their chunk. Chunks are sent as usual on failure.
+        '''
+        try:
+            self._shared_input = SharedInput(self._map_tasks.pending)
+        except OSError as e:
+            self._log.error(f"Couldn't share map input: {e}")
+
+    def _release_map_input(self):
+        ''' Removes the shared map input, if any. '''
+        if self._shared_input is not None:
+            self._shared_input.close()
+            self._shared_input = None
+
+    def _merge_reduce_stripes(self):
+        '''
+        Moves the striped intermediate values into the pending reduce tasks. Must be
+        called holding `_reduce_tasks_lock`.
+        '''
+        pending = self._reduce_tasks.pending
+        for stripe, lock in zip(self._reduce_stripes, self._reduce_stripe_locks):
+            with lock:
+                for key, values in stripe.items():
+                    if key in pending:
+                        for value in values:
+                            append_value(pending, key, value)
+                    else:
+                        pending[key] = values
+                stripe.clear()
+
+    def _reset_reduce_stripes(self):
+        '''
+        Drops the striped intermediate values, which a previous run may have left
+        unmerged. Must be called holding `_reduce_tasks_lock`.
+        '''
+        for stripe, lock in zip(self._reduce_stripes, self._reduce_stripe_locks):
+            with lock:
+                stripe.clear()
+
+    def _partition_reduce_tasks(self):
+        '''
+        Replaces the per-key pending reduce tasks with one partition per follower.
+        Partitions restored from a backup are kept as they are.
+        '''
+        with self._followers_lock, self._reduce_tasks_lock:
+            count = max(1, len(self._all_followers))
+            pending = self._reduce_tasks.pending
+            groups = { key: values for key, values in pending.items()
+                       if not isinstance(values, Partition) }
+            if groups:
+                for key in groups:
+                    del pending[key]
+                for i, partition in enumerate(sample_partitions(groups, count)):
+                    pending[f'partition/{i}'] = partition
+                self._state_version = next(self._versions)
+                self._log.info(f'Balanced {len(groups)} reduce keys into {count} partitions.')
+
+    async def _master_loop(self):
+        '''
+        Main loop of the master server. Blocking calls are run on the dispatch pool.
         '''
         # Timeout 
-        time.sleep(1)
+        await self._wait(self._stop_evt, 1)
 
-        # Await nameserver, DHT and a request.
+        # Await nameserver, DHT and a request, backing off exponentially.
+        delay = REQUEST_BACKOFF_MIN
         while self._alive:
             try:
-                if sf := self._get_serialized_functions():
-                    logger.info('Found map-reduce request.')
-                    self._map_function, self._reduce_function = sf
+                if sf := await self._call(self._get_serialized_functions):
+                    self._log.info('Found map-reduce request.')
+                    self._map_function, self._reduce_function, self._combine_function = sf
+                    self._map_tag = function_tag(self._map_function)
+                    self._reduce_tag = function_tag(self._reduce_function)
+                    self._balance = await self._call(self._get_balance)
                     break
             except (Pyro4.errors.CommunicationError, Pyro4.errors.NamingError):
-                time.sleep(REQUEST_TIMEOUT)
+                pass
+            await self._wait(self._stop_evt, delay)
+            delay = min(delay * 2, REQUEST_TIMEOUT)
 
         # Startup begins.
         # self._start_time = time.time()
 
         # Check for backup.
         if self._alive:
-            if backup := self._get_backup():
+            if backup := await self._call(self._get_backup):
                 # Load tasks, assume the assigned tasks have to be redone.
-                self._map_tasks.load(backup[0])
-                self._map_tasks.reset_assigned_to_pending()
-                self._reduce_tasks.load(backup[1])
-                self._reduce_tasks.reset_assigned_to_pending()
-
-                # Load followers, assume all as idle.
-                self._followers.clear()
-                self._idle_followers = backup[2]
+                with self._map_tasks_lock:
+                    self._map_tasks.load(backup[0])
+                    self._map_tasks.reset_assigned_to_pending()
+                with self._reduce_tasks_lock:
+                    self._reduce_tasks.load(backup[1])
+                    self._reduce_tasks.reset_assigned_to_pending()
+                    self._reset_reduce_stripes()
+
+                # Load followers, assume all as idle. The set is updated in place, so
+                # followers which subscribed in the meantime are kept.
+                with self._followers_lock:
+                    self._followers.clear()
+                    self._idle_followers.update(backup[2])
+                    self._all_followers.clear()
+                    self._all_followers.update(self._idle_followers)
 
                 # Load results.
-                self._results.clear()
-                self._results = backup[3]
+                with self._results_lock:
+                    self._results.clear()
+                    self._results.update(backup[3])
 
-                logger.info('Loaded backup from previous master.')
+                self._log.info('Loaded backup from previous master.')
             else:
                 # Split the input data into smaller chunks, which will be mapped.
                 self._map_tasks.reset()
-                self._reduce_tasks.reset()
-                self._map_tasks.pending = self._get_request_data()
+                with self._reduce_tasks_lock:
+                    self._reduce_tasks.reset()
+                    self._reset_reduce_stripes()
+                self._map_tasks.pending.update(await self._call(self._get_request_data) or {})
+
+                self._log.info('No backup found. Started from scratch.')
 
-                logger.info('No backup found. Started from scratch.')
+        # Share the raw map input with colocated followers, if enabled.
+        if SHARE_INPUT and self._alive and self._map_tasks.pending:
+            self._share_map_input()
 
         # Start backing up data.
         if self._alive:
-            self._backup_thread = spawn_thread(self._backup_loop)
+            self._backup_task = asyncio.ensure_future(self._backup_loop())
 
         # Await all map tasks.
         if self._alive:
-            logger.info('Started map tasks.')
+            self._log.info('Started map tasks.')
             while self._alive and self._map_tasks.any:
-                self._assign_task(self._map_tasks, self._map_function)
-                time.sleep(REQUEST_TIMEOUT)
+                await self._await_work(self._map_tasks, self._map_function)
+            self._release_map_input()
+
+        # Gather the intermediate values as reduce tasks.
+        if self._alive:
+            with self._reduce_tasks_lock:
+                self._merge_reduce_stripes()
+
+        # Group reduce keys into balanced partitions if requested.
+        if self._alive and self._balance == 'sample':
+            await self._call(self._partition_reduce_tasks)
 
         # Await all reduce tasks.
         if self._alive:
-            logger.info('Started reduce tasks')
+            self._log.info('Started reduce tasks')
             while self._alive and self._reduce_tasks.any:
-                self._assign_task(self._reduce_tasks, self._reduce_function)
-                time.sleep(REQUEST_TIMEOUT)
+                await self._await_work(self._reduce_tasks, self._reduce_function)
         
         # Post results to DHT and notify the request if finished.
         if self._alive:
-            logger.info('Committing final results to DHT.')
-            with self._dht_service as dht:
-                dht.insert(RESULTS_KEY, self._results)
-
-            # Notify results to request handler.
-            with Pyro4.locateNS() as ns:
-                with Proxy(ns.lookup(RQ_HANDLER_NAME)) as rqh:
-                    rqh.notify_results()
+            self._log.info('Committing final results to DHT.')
+            try:
+                await self._call(self._commit_results)
+            except Exception:
+                self._log.exception("Couldn't commit final results.")
+                raise
+
+    def _commit_results(self):
+        ''' Posts the results to the DHT, then notifies the request handler. '''
+        self._dht_call('insert', RESULTS_KEY, self._results)
+        with self._nameserver as ns:
+            rqh_addr = ns.lookup(RQ_HANDLER_NAME)
+        with self._pooled(rqh_addr) as rqh:
+            rqh.notify_results()
     
-    def _backup_loop(self):
+    async def _backup_loop(self):
         '''
         Main loop of the master server periodic backup task.
         '''
-        logger.info('Started backup thread.')
+        self._log.info('Started backup loop.')
+        backed_up_version = None
         while self._alive:
             try:
-                # Backup the current state. Lock up all threads to prevent interference.
+                # Snapshot the current state, locking up all threads only while copying.
+                # Serialization and sending happen outside, and only if it changed.
                 with ( self._followers_lock, self._results_lock,
-                       self._map_tasks_lock, self._reduce_tasks_lock,
-                       self._dht_service as dht ):
-                    dht.insert(MASTER_BACKUP_KEY, (self._map_tasks.dump(),
-                                                   self._reduce_tasks.dump(),
-                                                   self._followers | self._idle_followers,
-                                                   self._results))
+                       self._map_tasks_lock, self._reduce_tasks_lock ):
+                    self._merge_reduce_stripes()
+                    version = self._state_version
+                    if version != backed_up_version:
+                        backup = (self._map_tasks.snapshot(),
+                                  self._reduce_tasks.snapshot(),
+                                  self._all_followers.copy(),
+                                  self._results.copy())
+                if version != backed_up_version:
+                    await self._call(self._send_backup, backup)
+                    backed_up_version = version
             except Pyro4.errors.CommunicationError:
-                logger.info("Couldn't backup data.") 
-            time.sleep(MASTER_BACKUP_INTERVAL)
\ No newline at end of file
+                self._log.info("Couldn't backup data.") 
+            await self._wait(self._stop_evt, MASTER_BACKUP_INTERVAL)
+
+    def _send_backup(self, backup: tuple):
+        '''
+        Posts a backup to the DHT. It is sent pre-pickled, so the DHT stores and
+        replicates an opaque blob.
+        '''
+        backup = pickle.dumps(backup, protocol=pickle.HIGHEST_PROTOCOL)
+        self._dht_call('insert', MASTER_BACKUP_KEY, backup)
@@ -1,14 +1,15 @@
 from logging import LoggerAdapter
 import time
+import uuid
 
 import Pyro4
 import Pyro4.errors
 from Pyro4 import Proxy, URI
 
-from map_reduce.server.utils import chunks_from, service_address
+from map_reduce.server.utils import buffer_chunks_from, chunks_from, locate_ns, service_address
 from map_reduce.server.configs import ( DHT_NAME, DHT_SERVICE_NAME, MASTER_MAP_CODE, MASTER_REDUCE_CODE,
-                                        MASTER_DATA, REQUEST_RETRIES, REQUEST_TIMEOUT,
-                                        IP, RESULTS_KEY )
+                                        MASTER_COMBINE_CODE, MASTER_BALANCE, MASTER_DATA, MASTER_TOKEN, REQUEST_RETRIES, REQUEST_TIMEOUT,
+                                        RESULTS_KEY, get_ip )
 from map_reduce.server.logger import get_logger
 logger = get_logger('rq')
 
@@ -20,13 +21,13 @@ class RequestHandler:
         self.address = address
         self.user_address = None
         global logger
-        logger = LoggerAdapter(logger, {'IP': IP})
+        logger = LoggerAdapter(logger, {'IP': get_ip()})
     
     def start(self):
         '''
         Start the request handler in the nameserver.
         '''
-        with Pyro4.locateNS() as ns:
+        with locate_ns() as ns:
             ns.register(self.address.object, self.address)
     
     def stop(self):
@@ -34,33 +35,45 @@ class RequestHandler:
         Remove the request handler from the nameserver.
         '''
         try:
-            with Pyro4.locateNS() as ns:
+            with locate_ns() as ns:
                 if ns.lookup(self.address.object) == self.address:
                     ns.remove(self.address.object)
         except Pyro4.errors.NamingError:
             pass
 
-    def startup(self, user_addr, input_data, map_function, reduce_function) -> bool:
+    def startup(self, user_addr, input_data, map_function, reduce_function,
+                combine_function=None, balance=None) -> bool:
         '''
         Start up the map-reduce process on the provided data. Request data is
         staged to DHT, input is split in chunks, functions stay serialized.
+        Input may be a list of lines or a `(raw, offsets)` buffer pair, whose
+        chunks are kept as raw slices until a follower maps them. The `balance`
+        strategy for reduce keys is staged along, `None` meaning one task per key.
 
         Returns True if the process was started successfully, False otherwise.
         '''
         logger.info(f'Received request from {user_addr!s}.')
         self.user_address = user_addr
-        input_data_chunks = { f'map/{i}': data for i,data in chunks_from(input_data).items() }
+        if isinstance(input_data, tuple):
+            chunks = buffer_chunks_from(*input_data)
+        else:
+            chunks = chunks_from(input_data)
+        input_data_chunks = { f'map/{i}': data for i,data in chunks.items() }
         logger.info(f'Chunks: {list(input_data_chunks.keys())}')
         for _ in range(REQUEST_RETRIES):
             try:
-                with Pyro4.locateNS() as ns:
+                with locate_ns() as ns:
                     dht_addr = ns.lookup(DHT_NAME)
                 with Proxy(service_address(dht_addr)) as dht:
-                    dht.insert(MASTER_MAP_CODE, map_function)
-                    dht.insert(MASTER_REDUCE_CODE, reduce_function)
-                    dht.insert(MASTER_DATA, input_data_chunks)
+                    # The master starts once the map and reduce code are found, so
+                    # these go last, after the rest of the request has landed.
+                    self._stage(dht, { MASTER_COMBINE_CODE: combine_function or b'',
+                                       MASTER_BALANCE: balance or 'none',
+                                       MASTER_DATA: input_data_chunks })
                     k = len(input_data_chunks)
                     logger.info(f'Pushed input data: {k} chunks: {input_data_chunks.keys()}.')
+                    dht.insert(MASTER_REDUCE_CODE, reduce_function)
+                    dht.insert(MASTER_MAP_CODE, map_function)
                 return True
             except Pyro4.errors.CommunicationError as e:
                 logger.error(f'{e.__class__.__name__}: {e}')
@@ -68,11 +81,29 @@ class RequestHandler:
                 continue
         return False
 
+    def _stage(self, dht: Proxy, items: dict):
+        '''
+        Inserts the items into the DHT, then a token unique to this request. Inserts
+        are made to wait for the DHT here, and only the small token is looked up
+        until it lands, so the input is never sent back.
+        '''
+        dht._pyroBind()
+        dht._pyroOneway.discard('insert')
+        token = uuid.uuid4().hex
+        for key, value in items.items():
+            dht.insert(key, value)
+        dht.insert(MASTER_TOKEN, token)
+        for _ in range(REQUEST_RETRIES):
+            if dht.lookup(MASTER_TOKEN) == token:
+                return
+            time.sleep(REQUEST_TIMEOUT)
+        raise Pyro4.errors.CommunicationError("Couldn't stage the request in DHT.")
+
     def notify_results(self):
         '''
         Notify the user who requested the process with the results.
         '''
-        with Pyro4.locateNS() as ns:
+        with locate_ns() as ns:
             with Proxy(service_address(ns.lookup(DHT_NAME))) as dht:
                 results = dht.lookup(RESULTS_KEY)
         with Proxy(self.user_address) as user:
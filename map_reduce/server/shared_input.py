@@ -0,0 +1,93 @@
+"""
+Shared memory for map input. When enabled through `MR_SHARE_INPUT`, the master packs
+the raw chunks of a job into a single segment, followers on the master's host then
+read their chunk from it instead of receiving a pickled copy over the network.
+"""
+from dataclasses import dataclass
+import errno
+from multiprocessing import resource_tracker
+import os
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+
+
+# Filesystem backing POSIX shared memory segments.
+SHM_PATH = '/dev/shm'
+
+def shm_free_space() -> int:
+    ''' Returns the free bytes for shared memory, None if it can't be told. '''
+    try:
+        stat = os.statvfs(SHM_PATH)
+    except (OSError, AttributeError):
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+@dataclass(frozen=True)
+class SharedChunk:
+    ''' Reference to a raw map chunk held in a shared memory segment. '''
+    name: str
+    start: int
+    end: int
+
+    def __len__(self):
+        return self.end - self.start
+
+
+class SharedInput:
+    '''
+    Owner of a shared memory segment holding the raw map chunks of a job. Chunks
+    which are not raw buffers are left out and have to be sent as they are.
+    '''
+    def __init__(self, chunks: dict):
+        raw = { task_id: chunk for task_id, chunk in chunks.items()
+                if isinstance(chunk, (bytes, bytearray)) }
+        size = max(1, sum(map(len, raw.values())))
+        # Writing past the free space of the backing tmpfs kills the process with
+        # SIGBUS instead of raising, so it is checked upfront.
+        free = shm_free_space()
+        if free is not None and size > free:
+            raise OSError(errno.ENOSPC, f'Input of {size} bytes exceeds the {free} '
+                                        f'bytes free in {SHM_PATH}')
+        self._shm = SharedMemory(create=True, size=size)
+        _owned.add(self._shm.name)
+        self._spans: dict[str, SharedChunk] = {}
+        pos = 0
+        for task_id, chunk in raw.items():
+            self._shm.buf[pos:pos+len(chunk)] = chunk
+            self._spans[task_id] = SharedChunk(self._shm.name, pos, pos+len(chunk))
+            pos += len(chunk)
+
+    def get(self, task_id) -> SharedChunk:
+        ''' Returns the reference to a task's chunk, None if it is not shared. '''
+        return self._spans.get(task_id)
+
+    def close(self):
+        ''' Releases and removes the segment, references to it become invalid. '''
+        self._shm.close()
+        self._shm.unlink()
+        _owned.discard(self._shm.name)
+
+
+# Segments created by this process, and segments attached by it. Only the latest
+# job's segment is kept attached.
+_owned: set[str] = set()
+_attached: dict[str, SharedMemory] = {}
+_attached_lock = Lock()
+
+def read_shared(chunk: SharedChunk) -> bytes:
+    '''
+    Copies a chunk out of its segment. Segments are attached once per process, and
+    are not tracked for cleanup since the master owns and unlinks them. Followers
+    running in the master's own process leave its tracking untouched.
+    '''
+    with _attached_lock:
+        shm = _attached.get(chunk.name)
+        if shm is None:
+            for stale in _attached.values():
+                stale.close()
+            _attached.clear()
+            shm = _attached[chunk.name] = SharedMemory(name=chunk.name)
+            if chunk.name not in _owned:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        return bytes(shm.buf[chunk.start:chunk.end])
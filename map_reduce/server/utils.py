@@ -1,21 +1,40 @@
 import logging
-import marshal
+from array import array
+from functools import lru_cache
 from threading import Lock
-from hashlib import sha1
+from hashlib import blake2b, sha1
 from threading import Thread
-import types
-from typing import Callable, Generic, TypeVar
+from typing import Callable, Generic, Iterable, TypeVar
 
+import cloudpickle
+import numpy as np
 import Pyro4
 import Pyro4.errors
 from Pyro4 import Proxy, URI
 
-from map_reduce.server.configs import IP, DAEMON_PORT, ITEMS_PER_CHUNK
+from map_reduce.server.configs import ( BROADCAST_PORT, DAEMON_PORT, ITEMS_PER_CHUNK,
+                                        BALANCE_SAMPLE_RATE, NS_ENABLE_BROADCAST, NS_HOSTS,
+                                        get_ip )
 
 SHA1_BIT_COUNT = 160
 
 
 # Pyro objects utilities.
+def locate_ns() -> Proxy:
+    '''
+    Returns a proxy to the nameserver. The configured `NS_HOSTS`, or this host if
+    none are configured, are asked directly first. The network is only broadcast
+    to if enabled.
+    '''
+    for host in NS_HOSTS or (get_ip(),):
+        try:
+            return Pyro4.locateNS(host=host, port=BROADCAST_PORT, broadcast=False)
+        except Pyro4.errors.NamingError:
+            continue
+    if NS_ENABLE_BROADCAST:
+        return Pyro4.locateNS()
+    raise Pyro4.errors.NamingError('No nameserver host answered.')
+
 def alive(proxy: Proxy) -> bool:
     ''' Returns True if the given proxy is alive. '''
     if proxy is None:
@@ -41,9 +60,9 @@ def unpack(uri: URI):
     assert isinstance(uri, URI), 'Provided `uri` to unpack must be of type `Pyro4.URI`.'
     return uri.object, uri.host, uri.port
 
-def daemon_address(name: str, ip: str = IP, port: int = DAEMON_PORT) -> URI:
-    ''' Returns the URI of the daemon. '''
-    return URI(f'PYRO:{name}@{ip}:{port}')
+def daemon_address(name: str, ip: str = None, port: int = DAEMON_PORT) -> URI:
+    ''' Returns the URI of the daemon, hosted on this machine unless `ip` is given. '''
+    return URI(f'PYRO:{name}@{ip or get_ip()}:{port}')
 
 def service_address(uri: URI) -> URI:
     name, host, port = unpack(uri)
@@ -84,13 +103,15 @@ class LockedObject(Generic[T]):
 
 def spawn_thread(target: Callable, args: tuple = (), kwargs: dict = {}) -> Thread:
     ''' Spawns a thread from a target function and arguments. '''
-    thread = Thread(target=target, args=args, kwargs=kwargs)
-    thread.setDaemon(True)
+    thread = Thread(target=target, args=args, kwargs=kwargs, daemon=True)
     thread.start()
     return thread
 
 def kill_thread(thread: Thread, logger: logging.Logger = None, timeout=1, name=''):
-    ''' Safely stops a thread from execution, and asserts its dead status. '''
+    '''
+    Joins a thread that was asked to stop, and asserts its dead status. Threads are
+    never killed, their loops must be woken up to exit on their own.
+    '''
     thread.join(timeout)
     if thread.is_alive() and logger is not None:
         if name:
@@ -100,11 +121,18 @@ def kill_thread(thread: Thread, logger: logging.Logger = None, timeout=1, name='
 
 
 # Function serialization.
-def serialize_function(func: Callable):
-    return marshal.dumps(func.__code__)
+def serialize_function(func: Callable) -> bytes:
+    ''' Serializes a function (closures included) into a portable payload. '''
+    return cloudpickle.dumps(func)
+
+def function_tag(bytes_: bytes) -> bytes:
+    ''' Returns a short fingerprint of a serialized function, telling tasks apart. '''
+    return blake2b(bytes_, digest_size=8).digest()
 
-def deserialize_function(bytes_: bytes, name: str = None) -> Callable:
-    return types.FunctionType(marshal.loads(bytes_), name=name)
+@lru_cache(maxsize=16)
+def deserialize_function(bytes_: bytes) -> Callable:
+    ''' Loads a serialized function. Repeated payloads are only loaded once. '''
+    return cloudpickle.loads(bytes_)
 
 
 # Helper functions.
@@ -112,4 +140,98 @@ def chunks_from(list, size=ITEMS_PER_CHUNK) -> dict[int, list]:
     '''
     Divide a list into evenly sized chunks. Last chunk may not have said size.
     '''
-    return { i: list[k:k+size] for i,k in enumerate(range(0,len(list),size)) }
\ No newline at end of file
+    return { i: list[k:k+size] for i,k in enumerate(range(0,len(list),size)) }
+
+def line_offsets(raw: bytes) -> array:
+    '''
+    Returns the offsets at which every line of a raw buffer starts, followed by the
+    offset where the last line ends. Line `i` spans `raw[offsets[i]:offsets[i+1]]`.
+    '''
+    offsets = array('Q', [0])
+    pos = raw.find(b'\n')
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = raw.find(b'\n', pos + 1)
+    if offsets[-1] != len(raw):
+        offsets.append(len(raw))
+    return offsets
+
+def pack_lines(lines: Iterable[str]) -> tuple[bytearray, array]:
+    '''
+    Packs an iterable of lines into a `(raw, offsets)` buffer pair, consuming it
+    lazily so the lines are never all held as separate objects.
+    '''
+    raw, offsets = bytearray(), array('Q', [0])
+    for line in lines:
+        raw += line.encode()
+        raw += b'\n'
+        offsets.append(len(raw))
+    return raw, offsets
+
+def buffer_chunks_from(raw: bytes, offsets: array, size=ITEMS_PER_CHUNK) -> dict[int, bytes]:
+    '''
+    Divide a raw buffer into slices of `size` lines each, according to the line
+    offsets provided. Last chunk may not have said size.
+    '''
+    count = len(offsets) - 1
+    return { i: raw[offsets[k]:offsets[min(k+size, count)]]
+             for i,k in enumerate(range(0,count,size)) }
+
+def lines_from(chunk) -> list:
+    '''
+    Materializes the lines of a map chunk. Raw buffer chunks are decoded, stripped
+    and cleaned from empty lines, any other chunk is returned as is. Bytes which are
+    not valid UTF-8 are replaced rather than failing the task.
+    '''
+    if isinstance(chunk, (bytes, bytearray)):
+        text = chunk.decode(errors='replace')
+        return [ line for line in map(str.strip, text.splitlines()) if line ]
+    return chunk
+
+def append_value(groups: dict, key, value):
+    '''
+    Appends a value to the group of its key. Integer groups are kept in compact int64
+    arrays, which turn into a list as soon as a value that does not fit is appended.
+    '''
+    values = groups.get(key)
+    if values is None:
+        values = groups[key] = array('q') if type(value) is int else []
+    elif type(value) is not int and isinstance(values, array):
+        values = groups[key] = list(values)
+    try:
+        values.append(value)
+    except OverflowError:
+        values = groups[key] = list(values)
+        values.append(value)
+
+def combine(pairs, func: Callable) -> list:
+    '''
+    Groups key-value pairs by key and folds every group with `func(key, values)`,
+    yielding a single pair per key.
+    '''
+    groups = {}
+    for key, value in pairs:
+        append_value(groups, key, value)
+    return [ (key, func(key, values)) for key, values in groups.items() ]
+
+class Partition(dict):
+    ''' A group of reduce keys and their values, reduced as a single task. '''
+
+def sample_partitions(groups: dict, count: int, rate=BALANCE_SAMPLE_RATE) -> list[Partition]:
+    '''
+    Splits grouped reduce values into `count` partitions of similar size. A sample
+    of the mapped pairs is drawn to estimate the key distribution, and its quantiles
+    become the partition boundaries over the keys' hashes.
+    '''
+    if not groups or count <= 1:
+        return [ Partition(groups) ] if groups else []
+    hashes = np.fromiter((hash(key) for key in groups), dtype=np.int64, count=len(groups))
+    weights = np.fromiter((len(values) for values in groups.values()), dtype=np.float64,
+                          count=len(groups))
+    size = max(int(weights.sum() * rate), count * 32)
+    sample = np.random.default_rng().choice(hashes, size=size, p=weights / weights.sum())
+    cuts = np.quantile(sample, np.linspace(0, 1, count + 1)[1:-1])
+    partitions = [ Partition() for _ in range(count) ]
+    for (key, values), i in zip(groups.items(), np.searchsorted(cuts, hashes, side='right')):
+        partitions[i][key] = values
+    return [ partition for partition in partitions if partition ]
@@ -0,0 +1,24 @@
+"""
+Vectorized map functions. These receive a whole chunk of lines per call instead of
+a single line, so the work for the chunk can be done in a few numpy calls.
+"""
+from typing import Callable
+
+import numpy as np
+
+
+def vectorizable_map(func: Callable) -> Callable:
+    ''' Marks a map function as taking `(task_id, lines)` for a whole chunk. '''
+    func.__vectorizable__ = True
+    return func
+
+@vectorizable_map
+def vectorized_word_count_map(task_id, lines: list[str]) -> list[tuple[str, int]]:
+    ''' Counts the whitespace separated words of a whole chunk of lines. '''
+    if not lines:
+        return []
+    tokens = np.concatenate(np.char.split(np.asarray(lines, dtype=str)))
+    if tokens.size == 0:
+        return []
+    keys, counts = np.unique(tokens, return_counts=True)
+    return list(zip(keys.tolist(), counts.tolist()))
@@ -0,0 +1,60 @@
+import unittest
+from Pyro4 import URI
+from map_reduce.server.nodes.master import Master, TaskGroup
+
+
+class TaskGroupTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tasks = TaskGroup({ 'map/0': 'a', 'map/1': 'b', 'map/2': 'c' })
+
+    def test_pop_pending_is_fifo(self):
+        self.assertEqual(self.tasks.pop_pending(), ('map/0', 'a'))
+        self.assertEqual(self.tasks.pop_pending(), ('map/1', 'b'))
+        self.tasks.pending['map/0'] = 'a'
+        self.assertEqual(self.tasks.pop_pending(), ('map/2', 'c'))
+        self.assertEqual(self.tasks.pop_pending(), ('map/0', 'a'))
+        self.assertTrue(self.tasks.none)
+
+    def test_set_assigned_as_complete(self):
+        task_id, task = self.tasks.pop_pending()
+        self.tasks.assigned[task_id] = task
+        self.assertTrue(self.tasks.set_as_complete(task_id))
+        self.assertEqual(self.tasks.completed, { 'map/0': 'a' })
+        self.assertNotIn(task_id, self.tasks.assigned)
+
+    def test_set_pending_as_complete(self):
+        self.assertTrue(self.tasks.set_as_complete('map/1'))
+        self.assertEqual(self.tasks.completed, { 'map/1': 'b' })
+        self.assertEqual(list(self.tasks.pending), ['map/0', 'map/2'])
+
+    def test_set_falsy_task_as_complete(self):
+        self.tasks.pending['map/3'] = []
+        self.assertTrue(self.tasks.set_as_complete('map/3'))
+        self.assertEqual(self.tasks.completed['map/3'], [])
+
+    def test_set_missing_as_complete(self):
+        self.assertFalse(self.tasks.set_as_complete('map/9'))
+        self.assertTrue(self.tasks.set_as_complete('map/0'))
+        self.assertFalse(self.tasks.set_as_complete('map/0'))
+        self.assertEqual(len(self.tasks.completed), 1)
+
+
+class MasterRestartTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.master = Master(URI('PYRO:master@127.0.0.1:9999'))
+
+    def tearDown(self) -> None:
+        self.master.stop()
+
+    def test_start_stop_start(self):
+        for _ in range(2):
+            self.master.start()
+            self.assertTrue(self.master._master_thread.is_alive())
+            self.assertEqual(self.master._dispatch_pool.submit(sum, [1, 2]).result(), 3)
+            self.master.stop()
+            self.assertFalse(self.master._master_thread.is_alive())
+        self.master.start()
+        self.assertEqual(self.master._dispatch_pool.submit(sum, [1, 2]).result(), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from array import array
+from typing import Any, Iterable, List, Tuple
+from map_reduce.client.client import SEQUENCE_TYPES, inspect_function
+from map_reduce.server.utils import ( Partition, append_value, buffer_chunks_from, combine,
+                                      line_offsets, lines_from, sample_partitions )
+
+
+class LinesFromTestCase(unittest.TestCase):
+    def test_lines_are_stripped(self):
+        self.assertEqual(lines_from(b' a b \n\n c\n'), ['a b', 'c'])
+
+    def test_non_utf8_input(self):
+        lines = lines_from(b'caf\xe9 ok\n\xff\xfe x\n')
+        self.assertEqual(lines, ['caf� ok', '�� x'])
+
+    def test_chunks_cut_on_lines(self):
+        raw = b'caf\xe9\nb\n\xffc\nd'
+        chunks = buffer_chunks_from(raw, line_offsets(raw), size=2)
+        self.assertEqual([lines_from(chunk) for chunk in chunks.values()],
+                         [['caf�', 'b'], ['�c', 'd']])
+
+    def test_non_raw_chunks_are_kept(self):
+        chunk = ['a', 'b']
+        self.assertIs(lines_from(chunk), chunk)
+
+
+class SamplePartitionsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.groups = { f'key{i}': [1] * (i % 7 + 1) for i in range(200) }
+
+    def test_partitions_cover_every_key_once(self):
+        partitions = sample_partitions(self.groups, 4)
+        self.assertTrue(all(isinstance(p, Partition) for p in partitions))
+        self.assertLessEqual(len(partitions), 4)
+        keys = [ key for partition in partitions for key in partition ]
+        self.assertCountEqual(keys, self.groups)
+        for partition in partitions:
+            for key, values in partition.items():
+                self.assertIs(values, self.groups[key])
+
+    def test_partitions_are_balanced(self):
+        partitions = sample_partitions(self.groups, 4)
+        sizes = [ sum(map(len, p.values())) for p in partitions ]
+        total = sum(map(len, self.groups.values()))
+        self.assertEqual(sum(sizes), total)
+        self.assertLess(max(sizes), total / 2)
+
+    def test_single_partition(self):
+        self.assertEqual(sample_partitions(self.groups, 1), [ Partition(self.groups) ])
+        self.assertEqual(sample_partitions({}, 4), [])
+
+
+class GroupValuesTestCase(unittest.TestCase):
+    def test_ints_are_grouped_in_arrays(self):
+        groups = {}
+        for value in (1, 2, 3):
+            append_value(groups, 'a', value)
+        self.assertEqual(groups['a'], array('q', [1, 2, 3]))
+
+    def test_other_values_are_grouped_in_lists(self):
+        groups = {}
+        append_value(groups, 'a', 'x')
+        append_value(groups, 'a', 2)
+        self.assertEqual(groups['a'], ['x', 2])
+
+    def test_non_int_value_turns_array_into_list(self):
+        groups = {}
+        append_value(groups, 'a', 1)
+        append_value(groups, 'a', 1.5)
+        self.assertEqual(groups['a'], [1, 1.5])
+
+    def test_int64_overflow_turns_array_into_list(self):
+        groups = {}
+        append_value(groups, 'a', 1)
+        append_value(groups, 'a', 2**63)
+        append_value(groups, 'a', 2)
+        self.assertEqual(groups['a'], [1, 2**63, 2])
+        self.assertIsInstance(groups['a'], list)
+
+    def test_combine_folds_every_key_once(self):
+        pairs = [ ('a', 1), ('b', 1), ('a', 2), ('c', 'x'), ('a', 3) ]
+        folded = combine(pairs, lambda key, values: (len(values), list(values)))
+        self.assertEqual(folded, [ ('a', (3, [1, 2, 3])), ('b', (1, [1])), ('c', (1, ['x'])) ])
+
+
+class InspectFunctionTestCase(unittest.TestCase):
+    def inspect_map(self, func):
+        return inspect_function(func, (str,), SEQUENCE_TYPES)
+
+    def test_annotated_function_passes(self):
+        def map_f(key: int, line: str) -> List[Tuple[str, int]]:
+            return []
+        def any_f(key, line: Any) -> Any:
+            return []
+        self.assertTrue(self.inspect_map(map_f))
+        self.assertTrue(self.inspect_map(any_f))
+
+    def test_unannotated_function_is_inconclusive(self):
+        self.assertIsNone(self.inspect_map(lambda key, line: []))
+        self.assertIsNone(self.inspect_map(print))
+
+    def test_arity_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.inspect_map(lambda line: [])
+        with self.assertRaises(ValueError):
+            self.inspect_map(lambda key, line, other: [])
+        self.assertIsNone(self.inspect_map(lambda key, line, other=None: []))
+        self.assertIsNone(self.inspect_map(lambda *args: []))
+
+    def test_value_hint_is_rejected(self):
+        def map_f(key: int, line: int) -> list:
+            return []
+        with self.assertRaises(ValueError):
+            self.inspect_map(map_f)
+
+    def test_return_hint_is_rejected(self):
+        def map_f(key: int, line: str) -> int:
+            return 0
+        def reduce_f(key: str, values: Iterable[int]) -> int:
+            return 0
+        with self.assertRaises(ValueError):
+            self.inspect_map(map_f)
+        self.assertTrue(inspect_function(reduce_f, SEQUENCE_TYPES, ()))
+
+if __name__ == "__main__":
+    unittest.main()